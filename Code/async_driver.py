@@ -0,0 +1,262 @@
+# Asyncio alternative to SunSpecDriver, every server is polled from one event loop over Modbus TCP
+# with a deadline on each request, so a slow server delays only its own values
+
+import asyncio
+import struct
+import threading
+import time
+
+import numpy as np
+import zmq
+import zmq.asyncio
+from sunspec.core.modbus.client import ModbusClientError
+
+from Code.message_channel import MessageChannel
+from Code.modbus_device import CONNECTION_ERRORS, ModbusDevice
+from Code.ring_buffer import RingBuffer
+from Code.system_drivers import check_publications, create_channels
+
+# Modbus TCP header: transaction id, protocol id, length and unit id
+MBAP = struct.Struct(">HHHB")
+READ_HOLDING_REGISTERS = 3
+WRITE_MULTIPLE_REGISTERS = 16
+
+# Errors after which a request is abandoned, the connection is reopened on the next request
+REQUEST_ERRORS = (asyncio.TimeoutError, asyncio.IncompleteReadError) + CONNECTION_ERRORS
+
+
+class AsyncModbusDevice(ModbusDevice):
+    def __init__(self, config_settings, device):
+        super().__init__(config_settings, device)
+
+        # Deadline for each request, including waiting for the connection and opening it
+        self.request_deadline = self.settings.driver["request_deadline"]
+
+        # Stream Connection, one request at a time
+        self.reader = None
+        self.writer = None
+        self.transaction = 0
+        self.connections = 0
+        self.lock = asyncio.Lock()
+
+        # Staleness and Latency Statistics
+        self.stale = False
+        self.stale_reads = 0
+        self.timeouts = 0
+        self.failed_writes = 0
+        self.last_read_time = None
+        self.latency = RingBuffer(self.settings.driver["latency_samples"], ("latency",))
+
+    def create_client(self):
+        # Requests are sent on an asyncio stream rather than through the blocking sunspec client
+        return None
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.device_settings["ipaddr"],
+                                                                 self.device_settings["ipport"])
+        if self.connections:
+            self.reconnects += 1
+        self.connections += 1
+        self.connected = True
+
+    def disconnect(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = None
+        self.writer = None
+        self.connected = False
+
+    async def transact(self, function_code, data):
+
+        # Sends one request and returns the response data after the function code
+        self.transaction = (self.transaction + 1) % 65536
+        pdu = struct.pack(">B", function_code) + data
+        self.writer.write(MBAP.pack(self.transaction, 0, len(pdu) + 1, self.device_settings["slave_id"]) + pdu)
+        await self.writer.drain()
+
+        transaction, protocol, length, unit = MBAP.unpack(await self.reader.readexactly(MBAP.size))
+        response = await self.reader.readexactly(length - 1)
+        if transaction != self.transaction:
+            raise ModbusClientError('Modbus transaction id mismatch')
+        if response[0] != function_code:
+            raise ModbusClientError('Modbus exception code %d' % response[1])
+        return response[1:]
+
+    async def request(self, function_code, data):
+        async with self.lock:
+            try:
+                if self.connected is False:
+                    await self.connect()
+                return await self.transact(function_code, data)
+            except (asyncio.CancelledError,) + REQUEST_ERRORS:
+                # A late response would be read as the answer to the next request
+                self.disconnect()
+                raise
+
+    async def read(self):
+
+        # Returns the decoded values, or None when a request fails or misses its deadline
+        read_start = time.time()
+        registers = dict()
+        try:
+            for start, count in self.blocks:
+                data = await asyncio.wait_for(self.request(READ_HOLDING_REGISTERS, struct.pack(">HH", start, count)),
+                                              self.request_deadline)
+                for offset, value in enumerate(struct.unpack(">%dh" % count, data[1:])):
+                    registers[start + offset] = value
+                self.block_reads += 1
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            return None
+        except REQUEST_ERRORS as error:
+            print('Failed ' + self.device + ' read: ' + str(error))
+            self.failed_reads += 1
+            return None
+
+        self.last_read_time = time.time()
+        self.latency.append(latency=self.last_read_time - read_start)
+        return self.decode(registers)
+
+    async def write(self, key, value):
+        data = struct.pack(">HHB", self.device_settings[key], 1, 2) + self.encode(key, value)
+        await asyncio.wait_for(self.request(WRITE_MULTIPLE_REGISTERS, data), self.request_deadline)
+
+    def statistics(self):
+        latency = self.latency.view("latency")
+        statistics = self.counters()
+        statistics.update({"stale": self.stale,
+                           "stale_reads": self.stale_reads,
+                           "timeouts": self.timeouts,
+                           "failed_writes": self.failed_writes,
+                           "age": time.time() - self.last_read_time if self.last_read_time else None,
+                           "last_latency": float(self.latency.latest("latency", default=0)),
+                           "mean_latency": float(np.mean(latency)) if len(latency) else 0,
+                           "p95_latency": float(np.percentile(latency, 95)) if len(latency) else 0,
+                           "max_latency": float(np.max(latency)) if len(latency) else 0})
+        return statistics
+
+
+class AsyncSunSpecDriver:
+    def __init__(self, config_settings):
+
+        # Reads settings configuration file
+        self.settings = config_settings
+        self.statistics_interval = self.settings.driver["statistics_interval"]
+
+        # Published devices from the driver settings, and a Modbus device per server
+        self.publications = self.settings.driver["devices"]
+        check_publications(self.settings, self.publications)
+        self.power_server = self.settings.driver["power_server"]
+        self.power_register = self.settings.driver["power_register"]
+        self.devices = {server: AsyncModbusDevice(self.settings, server)
+                        for server in {device["server"] for device in self.publications} | {self.power_server}}
+
+        # Connection Variables
+        self.connected = False
+        self.initial_time = None
+
+        # ZeroMQ Settings
+        self.sub_port = str(self.settings.ZeroMQ["battery_power_port"])
+        self.batteryW_topic = str(self.settings.ZeroMQ["battery_power_topic"])
+
+        # Defines Channels, Events and Thread (created in the event loop)
+        self.channels = dict()
+        self.sub_socket = None
+        self.sub_channel = None
+        self.events = dict()
+        self.driver_thread = None
+
+        # Starts Drivers
+        self.start_drivers()
+
+    def start_drivers(self):
+        self.channels = create_channels(self.settings, zmq.Context(), self.publications)
+
+        # Battery power setpoints are received in the event loop
+        self.sub_socket = zmq.asyncio.Context().socket(zmq.SUB)
+        self.sub_channel = MessageChannel(self.settings, self.sub_socket, self.batteryW_topic)
+
+        # Starts Event Loop Thread
+        print('starting asyncio drivers')
+        self.driver_thread = threading.Thread(target=asyncio.run, args=(self.run(),))
+        self.driver_thread.start()
+
+    async def run(self):
+        self.events = {device["name"]: asyncio.Event() for device in self.publications}
+        tasks = [self.publisher(device) for device in self.publications]
+        tasks.append(self.battery_subscriber())
+        if self.statistics_interval:
+            tasks.append(self.report_statistics())
+        await asyncio.gather(*tasks)
+
+    async def publisher(self, device):
+        name = device["name"]
+        channel = self.channels[name]
+        poll_interval = device["poll_interval"]
+
+        # Makes sure initial connection is established
+        while not self.connected:
+            channel.send_token(device["token"])
+            await asyncio.sleep(0.01)
+
+        while True:
+            await self.publish(device, channel)
+
+            # Reads after each new battery power, or every poll interval
+            if device["event_read"]:
+                await self.events[name].wait()
+                self.events[name].clear()
+            else:
+                await asyncio.sleep(poll_interval - ((time.time() - self.initial_time) % poll_interval))
+
+    async def publish(self, device, channel):
+        modbus_device = self.devices[device["server"]]
+
+        # A failed or late read publishes the last value with the time it was read, flagged as stale
+        if await modbus_device.read() is None:
+            if not modbus_device.stale:
+                print('Stale ' + device["name"] + ' value')
+            modbus_device.stale = True
+            modbus_device.stale_reads += 1
+        else:
+            modbus_device.stale = False
+
+        channel.send(modbus_device.values.get(device["register"], device.get("initial_value", 0)),
+                     modbus_device.last_read_time)
+
+    async def battery_subscriber(self):
+        # Connects Subscriber to socket and topic
+        self.sub_socket.connect("tcp://localhost:%s" % self.sub_port)
+        self.sub_socket.setsockopt_string(zmq.SUBSCRIBE, self.batteryW_topic)
+
+        while True:
+            # ZeroMQ Subscribing
+            bat_power = self.sub_channel.decode(await self.sub_socket.recv_multipart())
+
+            # Makes sure initial connection is established
+            if bat_power == b'connected':
+                self.initial_time = time.time()
+                self.connected = True
+            else:
+                # Writes new Power Value to Battery Server
+                try:
+                    await self.devices[self.power_server].write(self.power_register, int(bat_power))
+                except REQUEST_ERRORS as error:
+                    print('Failed battery write: ' + repr(error))
+                    self.devices[self.power_server].failed_writes += 1
+
+                # Sets to read new values from servers
+                for event in self.events.values():
+                    event.set()
+
+    def statistics(self):
+        return {device: modbus_device.statistics() for device, modbus_device in self.devices.items()}
+
+    async def report_statistics(self):
+        while True:
+            await asyncio.sleep(self.statistics_interval)
+            for device, statistics in self.statistics().items():
+                print(device + ' reads = ' + str(statistics["reads"]) + ', stale = ' + str(statistics["stale_reads"])
+                      + ', timeouts = ' + str(statistics["timeouts"]) + ', mean latency = '
+                      + str(round(statistics["mean_latency"] * 1000, 2)) + ' ms, p95 latency = '
+                      + str(round(statistics["p95_latency"] * 1000, 2)) + ' ms')
@@ -6,46 +6,45 @@ import numpy as np
 import zmq
 
 from Code.kalman_filter import KalmanFilter
+from Code.message_channel import MessageChannel
+from Code.ring_buffer import TimeSeriesStore
+from Code.sample_fusion import SampleFusion
+from Code.telemetry_writer import TelemetryWriter
 
 
 class Subscriber:
-    def __init__(self, config_settings):
+    def __init__(self, config_settings, connect=True):
 
         # Obtains settings from config file
         self.settings = config_settings
 
-        # Parameters and Initial Values
-        self.battery_read = 0
-        self.solar_read = 0
-        self.house_read = 0
+        # Device topics to subscribe to, soc, solar and house are used by the control system
+        self.subscriptions = self.settings.ZeroMQ["subscriptions"]
+        self.devices = [subscription["device"] for subscription in self.subscriptions]
 
-        self.bat_SOC = self.settings.battery["initial_SOC"]
-        self.solar_power = 0
-        self.house_power = 0
+        # Latest complete sample set taken by the control loop, one value per device
+        self.sample = {device: 0 for device in self.devices}
+        self.sample["soc"] = self.settings.battery["initial_SOC"]
+
+        # Joins the device streams by source time into one record per control tick,
+        # the latest record waits for the control loop
+        self.fusion = SampleFusion(self.settings, self.devices)
+        self.next_sample = None
+        self.sample_time = None
+        self.sample_condition = threading.Condition()
+        self.sample_count = 0
 
         self.day_count = 0
-        self.soc_num = 0
-        self.solar_num = 0
-        self.house_num = 0
         self.initial_time = 0
 
-        # Creates Thread Lock
-        self.lock = threading.Lock()
-
-        # Erases Previous Text File Contents
-        open("control_power_values.txt", "w+").close()
+        # Starts Telemetry Writer (erases previous text file contents)
+        self.telemetry = TelemetryWriter(self.settings)
 
-        # Creates Internal Data Store
+        # Creates Internal Data Store (time, value and plot value, kept for the retention window)
         self.data_store = dict()
-        self.data_store["soc_time"] = list()
-        self.data_store["soc_value"] = list()
-        self.data_store["soc_plot"] = list()
-        self.data_store["solar_time"] = list()
-        self.data_store["solar_value"] = list()
-        self.data_store["solar_plot"] = list()
-        self.data_store["house_time"] = list()
-        self.data_store["house_value"] = list()
-        self.data_store["house_plot"] = list()
+        for subscription in self.subscriptions:
+            self.data_store[subscription["device"]] = TimeSeriesStore(self.retention_samples(subscription),
+                                                                      ("value", "plot"))
 
         # Sets up Kalman Filters
         self.solar_cov = self.settings.control["solar_cov"]
@@ -53,162 +52,190 @@ class Subscriber:
         self.house_cov = self.settings.control["house_cov"]
         self.house_filter = KalmanFilter(1, 0, 1, 700, 1, self.house_cov, 1)
 
-        # Defines Sockets and Threads
-        self.bat_socket = None
-        self.solar_socket = None
-        self.house_socket = None
+        self.filters = dict()
+        if self.settings.control["solar_filtering"]:
+            self.filters["solar"] = self.solar_filter
+        if self.settings.control["house_filtering"]:
+            self.filters["house"] = self.house_filter
+
+        # Defines Message Channels and Thread
+        self.channels = dict()
+        self.subscriber_thread = None
+
+        # Starts Subscribers, values are passed to process_value directly when not connecting
+        if connect:
+            self.start_subscribers()
+
+    # Values of the latest sample set taken by the control loop
+    @property
+    def bat_SOC(self):
+        return self.sample["soc"]
+
+    @property
+    def solar_power(self):
+        return self.sample["solar"]
+
+    @property
+    def house_power(self):
+        return self.sample["house"]
+
+    # Number of values received from each device
+    @property
+    def soc_num(self):
+        return self.data_store["soc"].count
 
-        self.bat_thread = None
-        self.solar_thread = None
-        self.house_thread = None
+    @property
+    def solar_num(self):
+        return self.data_store["solar"].count
 
-        # Starts Subscribers
-        self.start_subscribers()
+    @property
+    def house_num(self):
+        return self.data_store["house"].count
 
     def write_to_text(self, device, curr_time, value):
 
-        self.lock.acquire()
+        # Queued for the telemetry writer thread, so never waits on the disk
+        self.telemetry.write(device, curr_time, value)
 
-        file = open("control_power_values.txt", "a+")
+    def retention_samples(self, subscription):
 
-        file.write("\n"+device+" "+str(curr_time)+" "+str(value))
-        file.close()
+        # Samples arrive every publish period in real time, otherwise every simulated time step,
+        # capped as fast publishing would otherwise allocate a very large store up front
+        if self.settings.simulation["use_real_time"]:
+            sample_period = subscription["pub_time"]
+        else:
+            sample_period = self.settings.simulation["time_step"] * 60
+        return min(int(self.settings.control["data_retention"] * 3600 / sample_period),
+                   self.settings.control["max_retention_samples"])
+
+    def fusion_statistics(self):
+        return self.fusion.counters()
+
+    def message_statistics(self):
 
-        self.lock.release()
+        # Missed messages and latency per topic (binary messages only)
+        return {device: channel.statistics() for device, channel in self.channels.items()}
 
     def update_data_store(self, device, value):
+        store = self.data_store[device]
 
         # New Value
         if device == "soc":
-            self.data_store[device + "_value"].append(value)
+            new_value = value
         else:
-            self.data_store[device + "_value"].append(value / 1000)
+            new_value = value / 1000
 
         # Time Value
         if self.settings.simulation["use_real_time"]:
             curr_time = (round(time.time() - self.initial_time, 2) / 3600) - (24 * self.day_count)
-        elif bool(self.data_store[device + "_time"]) is False:
+        elif bool(store) is False:
             curr_time = 0
         else:
-            curr_time = self.data_store[device + "_time"][-1] + self.settings.simulation["time_step"] / 60
+            curr_time = store.latest("time") + self.settings.simulation["time_step"] / 60
             if abs(curr_time - 24) < 0.02:
                 curr_time = 0
-        self.data_store[device + "_time"].append(curr_time)
 
         # Plot Value
-        if 24 - self.data_store[device + "_time"][-1] <= 0.1:
-            self.data_store[device + "_plot"].append(np.nan)
+        if 24 - curr_time <= 0.1:
+            plot_value = np.nan
         else:
             if device == "soc":
-                self.data_store[device + "_plot"].append(value / (100 / 6))
+                plot_value = value / (100 / 6)
             else:
-                self.data_store[device + "_plot"].append(value / 1000)
+                plot_value = value / 1000
+
+        store.append(time=curr_time, value=new_value, plot=plot_value)
 
     def start_subscribers(self):
 
-        # Connects Sockets
+        # Connects a socket and message channel per device topic
         sub_context = zmq.Context()
-        self.bat_socket = sub_context.socket(zmq.SUB)
-        self.bat_socket.connect("tcp://localhost:%s" % self.settings.ZeroMQ["battery_SOC_port"])
-        self.bat_socket.setsockopt_string(zmq.SUBSCRIBE, str(self.settings.ZeroMQ["battery_SOC_topic"]))
-        self.solar_socket = sub_context.socket(zmq.SUB)
-        self.solar_socket.connect("tcp://localhost:%s" % self.settings.ZeroMQ["solar_port"])
-        self.solar_socket.setsockopt_string(zmq.SUBSCRIBE, str(self.settings.ZeroMQ["solar_topic"]))
-        self.house_socket = sub_context.socket(zmq.SUB)
-        self.house_socket.connect("tcp://localhost:%s" % self.settings.ZeroMQ["house_port"])
-        self.house_socket.setsockopt_string(zmq.SUBSCRIBE, str(self.settings.ZeroMQ["house_topic"]))
-
-        # Starts Battery Sub Thread
-        print('starting battery SOC subscriber')
-        self.bat_thread = threading.Thread(target=self.battery_subscriber)
-        self.bat_thread.start()
-
-        # Starts Solar Sub Thread
-        print('starting solar subscriber')
-        self.solar_thread = threading.Thread(target=self.solar_subscriber)
-        self.solar_thread.start()
-
-        # Starts House Sub Thread
-        print('starting house subscriber')
-        self.house_thread = threading.Thread(target=self.house_subscriber)
-        self.house_thread.start()
-
-    def battery_subscriber(self):
-        while True:
-            # Obtains Value from Topic
-            bat_string = self.bat_socket.recv()
-            b_topic, self.bat_SOC = bat_string.split()
-
-            # Runs if not connecting
-            if self.bat_SOC != b'bat_connect':
-
-                # Converts to int
-                self.bat_SOC = int(self.bat_SOC)
+        for subscription in self.subscriptions:
+            socket = sub_context.socket(zmq.SUB)
+            socket.connect("tcp://localhost:%s" % subscription["port"])
+            socket.setsockopt_string(zmq.SUBSCRIBE, str(subscription["topic"]))
+            self.channels[subscription["device"]] = MessageChannel(self.settings, socket, subscription["topic"])
+
+        # Starts Subscriber Thread, one thread serves every topic
+        print('starting subscribers for ' + ', '.join(self.devices))
+        self.subscriber_thread = threading.Thread(target=self.poll_subscribers)
+        self.subscriber_thread.daemon = True
+        self.subscriber_thread.start()
+
+    def poll_subscribers(self):
+        poller = zmq.Poller()
+        sockets = dict()
+        for device, channel in self.channels.items():
+            poller.register(channel.socket, zmq.POLLIN)
+            sockets[channel.socket] = device
 
-                # Updates Text File and Data Store
-                curr_time = (round(time.time() - self.initial_time, 2) / 3600) - (24 * self.day_count)
-                self.write_to_text("SOC", curr_time, self.bat_SOC)
-                self.update_data_store("soc", self.bat_SOC)
-
-                # Sets Read and Increases Counter
-                self.soc_num += 1
-                self.battery_read = 1
-
-    def solar_subscriber(self):
-        while True:
-            # Obtains Value from Topic
-            solar_string = self.solar_socket.recv()
-            s_topic, self.solar_power = solar_string.split()
-
-            # Runs if not connecting
-            if self.solar_power != b'solar_connect':
-
-                # Converts to int
-                self.solar_power = int(self.solar_power)
-
-                # Applies Filtering
-                if self.settings.control["solar_filtering"]:
-                    self.solar_filter.step(0, self.solar_power)
-                    self.solar_power = self.solar_filter.current_state()
-
-                # Updates Text File and Data Store
-                curr_time = (round(time.time() - self.initial_time, 2) / 3600) - (24 * self.day_count)
-                self.write_to_text("solar", curr_time, self.solar_power)
-                self.update_data_store("solar", self.solar_power)
-
-                # Sets Read and Increases Counter
-                self.solar_num += 1
-                self.solar_read = 1
-
-    def house_subscriber(self):
         while True:
-            # Obtains Value from Topic
-            house_string = self.house_socket.recv()
-            h_topic, self.house_power = house_string.split()
-
-            # Runs if not connecting
-            if self.house_power != b'house_connect':
-
-                # Converts to int
-                self.house_power = int(self.house_power)
-
-                # Applies Filtering
-                if self.settings.control["house_filtering"]:
-                    self.house_filter.step(0, self.house_power)
-                    self.house_power = self.house_filter.current_state()
-
-                # Updates Text File and Data Store
-                curr_time = (round(time.time() - self.initial_time, 2) / 3600) - (24 * self.day_count)
-                self.write_to_text("house", curr_time, self.house_power)
-                self.update_data_store("house", self.house_power)
-
-                # Sets Read and Increases Counter
-                self.house_num += 1
-                self.house_read = 1
+            # Waits for any topic, or until a waiting tick reaches the end of its lateness window
+            deadline = self.fusion.time_to_deadline(time.time())
+            for socket, event in poller.poll(None if deadline is None else deadline * 1000):
+                self.receive_value(sockets[socket])
+            self.emit_samples()
+
+    def receive_value(self, device):
+        channel = self.channels[device]
+        value = channel.receive()
+        self.process_value(device, value, channel.last_source_time)
+
+    def process_value(self, device, value, source_time):
+
+        # Connection messages are passed straight to the control system
+        try:
+            value = int(value)
+        except ValueError:
+            with self.sample_condition:
+                self.sample[device] = value
+                self.sample_condition.notify_all()
+            return
+
+        # Applies Filtering
+        if device in self.filters:
+            self.filters[device].step(0, value)
+            value = self.filters[device].current_state()
+
+        # Updates Text File and Data Store
+        curr_time = (round(time.time() - self.initial_time, 2) / 3600) - (24 * self.day_count)
+        self.write_to_text("SOC" if device == "soc" else device, curr_time, value)
+        self.update_data_store(device, value)
+
+        # Passes the value to the fusion stage at the time it was read
+        self.fusion.add(device, source_time, value)
+
+    def emit_samples(self, now=None):
+
+        # Hands over the newest aligned record, an unread older record is replaced
+        records = self.fusion.ready(time.time() if now is None else now)
+        if records:
+            with self.sample_condition:
+                self.sample_time, self.next_sample = records[-1]
+                self.sample_count += len(records)
+                self.sample_condition.notify_all()
+
+    def wait_for_sample(self, timeout):
+
+        # Sleeps until a sample set or connection message arrives, or the timeout (seconds) passes
+        with self.sample_condition:
+            if self.next_sample is None:
+                self.sample_condition.wait(timeout)
+            return self.next_sample is not None
+
+    def take_sample(self):
+
+        # Makes the waiting sample set current, returns False if there is none
+        with self.sample_condition:
+            if self.next_sample is None:
+                return False
+            self.sample = self.next_sample
+            self.next_sample = None
+            return True
 
 
 class Publisher:
-    def __init__(self, config_settings):
+    def __init__(self, config_settings, connect=True):
 
         # Obtains config file settings and starts Subscribers
         self.settings = config_settings
@@ -233,19 +260,22 @@ class Publisher:
         self.bat_cov = self.settings.control["bat_cov"]
         self.battery_filter = KalmanFilter(1, 0, 1, 0, 1, self.bat_cov, 1)
 
-        # Creates Internal Data Store
+        # Creates Internal Data Store (time, power and plot value, kept for the retention window)
+        retention_samples = int(self.settings.control["data_retention"] * 60 / self.settings.control["data_time_step"])
         self.data_store = dict()
-        self.data_store["bat_power"] = list()
-        self.data_store["bat_plot"] = list()
-        self.data_store["bat_time"] = list()
-        self.data_store["grid_power"] = list()
-        self.data_store["grid_plot"] = list()
-        self.data_store["grid_time"] = list()
-
-        # ZeroMQ Publishing
-        pub_context = zmq.Context()
-        self.pub_socket = pub_context.socket(zmq.PUB)
-        self.pub_socket.bind("tcp://*:%s" % str(self.settings.ZeroMQ["battery_power_port"]))
+        self.data_store["bat"] = TimeSeriesStore(retention_samples, ("power", "plot"))
+        self.data_store["grid"] = TimeSeriesStore(retention_samples, ("power", "plot"))
+
+        # ZeroMQ Publishing, the published power is only counted when not connecting
+        self.publish_count = 0
+        self.pub_socket = None
+        self.power_channel = None
+        if connect:
+            pub_context = zmq.Context()
+            self.pub_socket = pub_context.socket(zmq.PUB)
+            self.pub_socket.bind("tcp://*:%s" % str(self.settings.ZeroMQ["battery_power_port"]))
+            self.power_channel = MessageChannel(self.settings, self.pub_socket,
+                                                self.settings.ZeroMQ["battery_power_topic"])
 
     def set_power(self, bat_power):
         self.bat_power = bat_power
@@ -256,21 +286,19 @@ class Publisher:
 
     def update_data_store(self, device, power, house_time):
 
-        # Power Value
-        self.data_store[device + "_power"].append(power / 1000)
-
         # Time Value
         if self.settings.simulation["use_real_time"]:
             curr_time = (round(time.time() - self.initial_time, 2) / 3600) - (24 * self.day_count)
         else:
             curr_time = house_time
-        self.data_store[device + "_time"].append(curr_time)
 
         # Plot Value
-        if 24 - self.data_store[device + "_time"][-1] < 0.1:
-            self.data_store[device + "_plot"].append(np.nan)
+        if 24 - curr_time < 0.1:
+            plot_value = np.nan
         else:
-            self.data_store[device + "_plot"].append(power / 1000)
+            plot_value = power / 1000
+
+        self.data_store[device].append(time=curr_time, power=power / 1000, plot=plot_value)
 
         # Increase total counters
         if device == "bat":
@@ -298,4 +326,6 @@ class Publisher:
             self.set_power(self.battery_filter.current_state())
 
     def publish_power(self):
-        self.pub_socket.send_string("%d %d" % (self.settings.ZeroMQ["battery_power_topic"], self.bat_power))
\ No newline at end of file
+        self.publish_count += 1
+        if self.power_channel is not None:
+            self.power_channel.send(self.bat_power)
\ No newline at end of file
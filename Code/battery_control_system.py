@@ -7,7 +7,8 @@ import numpy as np
 import matplotlib.pyplot as plt
 
 from Code.system_drivers import SunSpecDriver
-from Code.optimiser_model import Optimiser
+from Code.async_driver import AsyncSunSpecDriver
+from Code.optimiser_model import BackgroundOptimiser, Optimiser
 from Code.kalman_filter import KalmanFilter
 from Code.battery_control_pubsub import Publisher, Subscriber
 
@@ -74,15 +75,15 @@ class DataVisualisation:
         self.solar_line.set_label('Solar Power')
         plt.legend()
 
-    def update_erase_index(self, house_time, b, s, h, g, p):
+    def update_erase_index(self, house_store, b, s, h, g, p):
 
         # Obtains the current time
         if self.settings.simulation["use_real_time"]:
             curr_time = (round(time.time() - self.initial_time, 2) / 3600) - (24 * self.day_count)
-        elif bool(house_time) is False:
+        elif bool(house_store) is False:
             curr_time = 0
         else:
-            curr_time = house_time[-1]
+            curr_time = house_store.latest("time")
 
         if curr_time >= 22 and self.plot_erase is False:
             self.b_index = b
@@ -101,25 +102,25 @@ class DataVisualisation:
 
     def update_plot(self, sub_data, pub_data):
 
-        # Update soc line if necessary
+        # Update soc line if necessary (views of the data stores, not copies)
         if self.display_soc:
-            soc_x = sub_data["soc_time"][self.plot_index[0]:]
-            soc_y = sub_data["soc_plot"][self.plot_index[0]:]
+            soc_x = sub_data["soc"].view("time", self.plot_index[0])
+            soc_y = sub_data["soc"].view("plot", self.plot_index[0])
             self.soc_line.set_data(soc_x, soc_y)
 
         # Updates grid line if necessary
         if self.display_grid:
-            grid_x = pub_data["grid_time"][self.plot_index[3]:]
-            grid_y = pub_data["grid_plot"][self.plot_index[3]:]
+            grid_x = pub_data["grid"].view("time", self.plot_index[3])
+            grid_y = pub_data["grid"].view("plot", self.plot_index[3])
             self.grid_line.set_data(grid_x, grid_y)
 
         # Sets x and y values for house, solar and battery lines
-        solar_x = sub_data["solar_time"][self.plot_index[1]:]
-        solar_y = sub_data["solar_plot"][self.plot_index[1]:]
-        house_x = sub_data["house_time"][self.plot_index[2]:]
-        house_y = sub_data["house_plot"][self.plot_index[2]:]
-        battery_x = pub_data["bat_time"][self.plot_index[4]:]
-        battery_y = pub_data["bat_plot"][self.plot_index[4]:]
+        solar_x = sub_data["solar"].view("time", self.plot_index[1])
+        solar_y = sub_data["solar"].view("plot", self.plot_index[1])
+        house_x = sub_data["house"].view("time", self.plot_index[2])
+        house_y = sub_data["house"].view("plot", self.plot_index[2])
+        battery_x = pub_data["bat"].view("time", self.plot_index[4])
+        battery_y = pub_data["bat"].view("plot", self.plot_index[4])
 
         # Updates house, solar and battery lines
         self.house_line.set_data(house_x, house_y)
@@ -131,13 +132,16 @@ class DataVisualisation:
 
 
 class ControlSystem:
-    def __init__(self, config_settings):
+    def __init__(self, config_settings, connect=True):
 
-        # Initialises Classes
+        # Initialises Classes, without sockets when driven in process by the simulation engine
         self.settings = config_settings
-        self.sub = Subscriber(config_settings)
-        self.pub = Publisher(config_settings)
+        self.sub = Subscriber(config_settings, connect)
+        self.pub = Publisher(config_settings, connect)
         self.optimiser = Optimiser(config_settings)
+        self.background_optimiser = None
+        if self.settings.control["optimiser"] and self.settings.control["background_optimiser"]:
+            self.background_optimiser = BackgroundOptimiser(config_settings)
         if self.settings.simulation["use_visualisation"]:
             self.plot = DataVisualisation(config_settings)
 
@@ -167,6 +171,13 @@ class ControlSystem:
         self.control_step = self.settings.control["control_time_step"]
         self.opt_step = self.settings.control["optimiser_time_step"]
 
+        # Loop waiting and CPU use per iteration (seconds)
+        self.max_loop_wait = self.settings.control["max_loop_wait"]
+        self.loop_count = 0
+        self.loop_cpu_time = 0
+        self.total_loop_cpu_time = 0
+        self.total_loop_wait_time = 0
+
         # Creates 24 hour data stores and filters
         self.power = None
         self.load = list(self.optimiser.load)
@@ -183,10 +194,10 @@ class ControlSystem:
         # Obtains the current time
         if self.settings.simulation["use_real_time"]:
             curr_time = (round(time.time() - self.sub.initial_time, 2) / 3600) - (24 * self.sub.day_count)
-        elif bool(self.sub.data_store["house_time"]) is False:
+        elif bool(self.sub.data_store["house"]) is False:
             curr_time = 0
         else:
-            curr_time = self.sub.data_store["house_time"][-1]
+            curr_time = self.sub.data_store["house"].latest("time")
         return curr_time
 
     def update_day_counter(self):
@@ -195,10 +206,10 @@ class ControlSystem:
         curr_time = self.current_time()
 
         # Obtains current house time
-        if bool(self.sub.data_store["house_time"]) is False:
+        if bool(self.sub.data_store["house"]) is False:
             curr_house_time = 0
         else:
-            curr_house_time = self.sub.data_store["house_time"][-1]
+            curr_house_time = self.sub.data_store["house"].latest("time")
 
         if 1 < curr_time < 23:
             self.prev_house_day = None
@@ -243,8 +254,8 @@ class ControlSystem:
                 self.pv_filter = KalmanFilter(1, 0, 1, self.pv[0], 1, self.covariance, 1)
 
                 # Apply Filters
-                self.load_filter.step(0, self.sub.data_store["house_value"][-(i + 1)] / (60 / self.time_step))
-                self.pv_filter.step(0, self.sub.data_store["solar_value"][-(i + 1)] / (60 / self.time_step))
+                self.load_filter.step(0, self.sub.data_store["house"].latest("value", i) / (60 / self.time_step))
+                self.pv_filter.step(0, self.sub.data_store["solar"].latest("value", i) / (60 / self.time_step))
 
                 # Remove First Value
                 self.load.pop(0)
@@ -274,34 +285,57 @@ class ControlSystem:
     def connection_loop(self):
         while self.connected is False:
 
+            # Sleeps until a subscriber receives a message
+            self.sub.wait_for_sample(self.max_loop_wait)
+
             # Checks for Initial Connection Values
             bat_connect = self.sub.bat_SOC == b'bat_connect'
             solar_connect = self.sub.solar_power == b'solar_connect'
             house_connect = self.sub.house_power == b'house_connect'
 
             connecting = bat_connect and solar_connect and house_connect
-            residual_connect = bat_connect or solar_connect or house_connect
 
             # Runs if Initial Connection is Established
             if connecting:
-                self.pub.pub_socket.send_string("%d %s" % (self.settings.ZeroMQ["battery_power_topic"], 'connected'))
+                self.pub.power_channel.send_token('connected')
                 self.initial_connect = True
 
-            # Runs if all Subscribers start returning intended values
-            if self.initial_connect and residual_connect is False:
+            # Runs once every Subscriber has returned an intended value
+            if self.initial_connect and self.sub.sample_count > 0:
                 self.connected = True
                 self.sub.initial_time = round(time.time(), 2)
                 self.pub.initial_time = self.sub.initial_time
                 if self.settings.simulation["use_visualisation"]:
                     self.plot.initial_time = self.sub.initial_time
 
+    def time_to_deadline(self):
+
+        # Samples drive every step in simulated time, in real time the loop also wakes at the next step boundary
+        if self.settings.simulation["use_real_time"] is False:
+            return self.max_loop_wait
+        step = min(self.time_step, self.control_step, self.opt_step) / 60
+        remaining = (step - self.current_time() % step) * 3600
+        return min(max(remaining, 0), self.max_loop_wait)
+
+    def loop_statistics(self):
+        return {"iterations": self.loop_count,
+                "last_cpu_time": self.loop_cpu_time,
+                "mean_cpu_time": self.total_loop_cpu_time / self.loop_count if self.loop_count else 0,
+                "mean_wait_time": self.total_loop_wait_time / self.loop_count if self.loop_count else 0}
+
     def main_loop(self):
 
+        # Sleeps until a new sample set arrives or the next deadline is reached
+        wait_start = time.time()
+        self.sub.wait_for_sample(self.time_to_deadline())
+        self.total_loop_wait_time += time.time() - wait_start
+        cpu_start = time.thread_time()
+
         # Updates day counter
         self.update_day_counter()
 
-        # Checks if all subscribers have new values
-        all_read = self.sub.battery_read == 1 and self.sub.solar_read == 1 and self.sub.house_read == 1
+        # Takes the latest complete sample set if all subscribers have new values
+        all_read = self.sub.take_sample()
 
         # Obtains the current time
         curr_time = self.current_time()
@@ -325,18 +359,34 @@ class ControlSystem:
             # Applies Control if necessary
             self.apply_control()
 
-            # Resets Subscriber Read Values
-            self.sub.battery_read = 0
-            self.sub.solar_read = 0
-            self.sub.house_read = 0
+        # CPU used by this iteration of the control thread
+        self.loop_cpu_time = time.thread_time() - cpu_start
+        self.total_loop_cpu_time += self.loop_cpu_time
+        self.loop_count += 1
+
+    def update_background_schedule(self, curr_time):
+
+        # Checks for a finished schedule without blocking
+        result = self.background_optimiser.poll()
+        if result is None:
+            return
+        snapshot_time, power = result
+        if power is None:
+            # Not solved, the current schedule is kept
+            return
+
+        # Realigns the schedule by the time elapsed since its snapshot (hours, wrapping at midnight)
+        elapsed_time = (curr_time - snapshot_time) % 24
+        self.optimiser_index = int(round(elapsed_time / (self.time_step / 60)))
+        self.power = list(power)
 
     def apply_control(self):
 
         # Obtains current house time
-        if bool(self.sub.data_store["house_time"]) is False:
+        if bool(self.sub.data_store["house"]) is False:
             curr_time = 0
         else:
-            curr_time = self.sub.data_store["house_time"][-1]
+            curr_time = self.sub.data_store["house"].latest("time")
 
         # Calculates new grid value
         self.pub.set_grid(self.sub.solar_power, self.sub.house_power)
@@ -352,14 +402,28 @@ class ControlSystem:
         # Optimiser Control
         if self.settings.control["optimiser"] and len(self.load) == (60 / self.time_step) * 24:
             if self.opt_mod and curr_time != self.prev_house_opt:
-                # Applies Control
-                self.data_skip = self.sub.house_num
-                self.optimiser.optimise()
-                self.power = list(self.optimiser.return_battery_power())
-                self.data_skip = self.sub.house_num - self.data_skip
-                self.optimiser_index = 0 + self.data_skip
+                if self.background_optimiser:
+                    # Sends a snapshot to the worker process and carries on with the current schedule
+                    self.background_optimiser.submit(self.load,
+                                                     self.pv,
+                                                     self.import_tariff,
+                                                     self.export_tariff,
+                                                     self.sub.bat_SOC,
+                                                     curr_time)
+                else:
+                    # Applies Control, the current schedule is kept when the problem is not solved
+                    self.data_skip = self.sub.house_num
+                    solved = self.optimiser.optimise()
+                    self.data_skip = self.sub.house_num - self.data_skip
+                    if solved:
+                        self.power = list(self.optimiser.return_battery_power())
+                        self.optimiser_index = 0 + self.data_skip
                 self.prev_house_opt = curr_time
 
+        # Switches to a finished background schedule
+        if self.background_optimiser:
+            self.update_background_schedule(curr_time)
+
         # Data Time Step
         if self.data_mod and curr_time != self.prev_house_data:
 
@@ -371,6 +435,32 @@ class ControlSystem:
             print('Total load energy = ' + str(round(self.house_energy, 2)) + ' kWh')
             print('Total solar energy = ' + str(round(self.solar_energy, 2)) + ' kWh')
             print('Day counter = ' + str(self.sub.day_count))
+            loop_statistics = self.loop_statistics()
+            print('Control loop iterations = ' + str(loop_statistics["iterations"]) + ', mean CPU = '
+                  + str(round(loop_statistics["mean_cpu_time"] * 1000, 3)) + ' ms, mean wait = '
+                  + str(round(loop_statistics["mean_wait_time"] * 1000, 1)) + ' ms')
+            fusion_statistics = self.sub.fusion_statistics()
+            print('Aligned sample records = ' + str(fusion_statistics["records"]) + ', late = '
+                  + str(fusion_statistics["late"]) + ', dropped = ' + str(fusion_statistics["dropped"])
+                  + ', interpolated = ' + str(fusion_statistics["interpolated"]) + ', carried forward = '
+                  + str(fusion_statistics["carried_forward"]))
+            telemetry_counters = self.sub.telemetry.counters()
+            print('Telemetry records written = ' + str(telemetry_counters["written"]) + ', dropped = '
+                  + str(telemetry_counters["dropped"]) + ', queued = ' + str(telemetry_counters["queued"])
+                  + ', mean flush latency = ' + str(round(telemetry_counters["mean_flush_latency"] * 1000, 2))
+                  + ' ms, max flush latency = ' + str(round(telemetry_counters["max_flush_latency"] * 1000, 2))
+                  + ' ms')
+            if self.settings.control["optimiser"]:
+                if self.background_optimiser:
+                    solve_time = self.background_optimiser.solve_time
+                else:
+                    solve_time = self.optimiser.solve_time
+                print('Optimiser solver = ' + self.optimiser.solver_name() + ', last solve time = '
+                      + ('none' if solve_time is None else str(round(solve_time * 1000, 1)) + ' ms'))
+            if self.settings.ZeroMQ["binary_messages"]:
+                for device, statistics in self.sub.message_statistics().items():
+                    print(device + ' messages missed = ' + str(statistics["missed"]) + ', mean latency = '
+                          + str(round(statistics["mean_latency"] * 1000, 2)) + ' ms')
 
             # Sets new power value
             if self.settings.control["pv_self_cons"] and self.settings.control["optimiser"]:
@@ -411,7 +501,10 @@ if __name__ == '__main__':
     # Reads settings configuration file and starts drivers
     settings = Settings()
     control = ControlSystem(settings)
-    drivers = SunSpecDriver(settings)
+    if settings.driver["mode"] == "asyncio":
+        drivers = AsyncSunSpecDriver(settings)
+    else:
+        drivers = SunSpecDriver(settings)
 
     # CONNECTION LOOP
     print('Connecting')
@@ -426,7 +519,7 @@ if __name__ == '__main__':
 
         # Data Visualisation
         if settings.simulation["use_visualisation"]:
-            control.plot.update_erase_index(control.sub.data_store["house_time"],
+            control.plot.update_erase_index(control.sub.data_store["house"],
                                             control.sub.soc_num,
                                             control.sub.solar_num,
                                             control.sub.house_num,
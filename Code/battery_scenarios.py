@@ -0,0 +1,102 @@
+import numpy as np
+
+
+class BatteryScenarios:
+    def __init__(self, max_capacity, charging_power_limit, discharging_power_limit, charging_efficiency=1.0,
+                 discharging_efficiency=1.0, depth_of_discharge_limit=0.0, initial_soc=0.0, time_step=5):
+
+        # One battery per scenario, every parameter is a scalar or an array with one value per scenario,
+        # capacities in kWh, power limits in kW (discharging negative), SOC in % of the usable capacity
+        parameters = np.broadcast_arrays(*[np.asarray(parameter, dtype=float) for parameter in (
+            max_capacity, charging_power_limit, discharging_power_limit, charging_efficiency,
+            discharging_efficiency, depth_of_discharge_limit, initial_soc)])
+        (self.max_capacity, self.charging_power_limit, self.discharging_power_limit, self.charging_efficiency,
+         self.discharging_efficiency, depth_of_discharge_limit, initial_soc) = [np.atleast_1d(parameter).copy()
+                                                                                for parameter in parameters]
+        self.number_of_scenarios = self.max_capacity.size
+
+        # Usable capacity, the DoD limit as a decimal or a percentage as in EnergyStorage
+        depth_of_discharge_limit = np.where(depth_of_discharge_limit > 1, depth_of_discharge_limit / 100,
+                                            depth_of_discharge_limit)
+        self.capacity = self.max_capacity * (1 - depth_of_discharge_limit)
+
+        # Stored energy (kWh) and the time step (hours)
+        self.energy = self.capacity * initial_soc / 100
+        self.dt = time_step / 60
+
+        # Scenario Totals (kWh at the battery terminals), curtailed is requested energy the battery could not take
+        # or give because of its power limits or state of charge
+        self.charged = np.zeros(self.number_of_scenarios)
+        self.discharged = np.zeros(self.number_of_scenarios)
+        self.curtailed = np.zeros(self.number_of_scenarios)
+        self.full_steps = np.zeros(self.number_of_scenarios, dtype=int)
+        self.empty_steps = np.zeros(self.number_of_scenarios, dtype=int)
+
+    @classmethod
+    def from_energy_storage(cls, energy_storages, time_step=5):
+
+        # Scenarios from optimiser EnergyStorage models, initial state of charge in kWh
+        def values(name):
+            return [getattr(storage, name) for storage in energy_storages]
+
+        initial_soc = [100 * storage.initial_state_of_charge / storage.capacity if storage.capacity else 0
+                       for storage in energy_storages]
+        return cls(values("max_capacity"), values("charging_power_limit"), values("discharging_power_limit"),
+                   values("charging_efficiency"), values("discharging_efficiency"),
+                   values("depth_of_discharge_limit"), initial_soc, time_step)
+
+    @classmethod
+    def from_settings(cls, config_settings, number_of_scenarios=1, **parameters):
+
+        # The configured battery, with any parameter replaced by an array of scenario values
+        battery = config_settings.battery
+        scenario = {"max_capacity": battery["max_capacity"],
+                    "charging_power_limit": battery["charging_power_limit"],
+                    "discharging_power_limit": battery["discharging_power_limit"],
+                    "charging_efficiency": battery["charging_efficiency"],
+                    "discharging_efficiency": battery["discharging_efficiency"],
+                    "depth_of_discharge_limit": battery["DOD_limit"],
+                    "initial_soc": np.full(number_of_scenarios, battery["initial_SOC"], dtype=float),
+                    "time_step": config_settings.control["data_time_step"]}
+        scenario.update(parameters)
+        return cls(**scenario)
+
+    @property
+    def soc(self):
+        # State of charge (%) of the usable capacity
+        return np.divide(100 * self.energy, self.capacity, out=np.zeros_like(self.energy), where=self.capacity > 0)
+
+    def step(self, power):
+
+        # Requested power (W, positive charging) for every scenario, returns the power applied (W)
+        requested = np.broadcast_to(np.asarray(power, dtype=float) / 1000, self.energy.shape)
+        limited = np.clip(requested, self.discharging_power_limit, self.charging_power_limit)
+
+        # Energy moved into storage after the charge or discharge efficiency, kept within the usable capacity
+        terminal_energy = limited * self.dt
+        stored = np.where(terminal_energy > 0, terminal_energy * self.charging_efficiency,
+                          terminal_energy / self.discharging_efficiency)
+        new_energy = np.clip(self.energy + stored, 0, self.capacity)
+        stored = new_energy - self.energy
+        self.energy = new_energy
+
+        # Energy at the terminals for the stored change actually made
+        terminal_energy = np.where(stored > 0, stored / self.charging_efficiency, stored * self.discharging_efficiency)
+        np.add(self.charged, np.maximum(terminal_energy, 0), out=self.charged)
+        np.subtract(self.discharged, np.minimum(terminal_energy, 0), out=self.discharged)
+        np.add(self.curtailed, np.abs(requested * self.dt - terminal_energy), out=self.curtailed)
+        self.full_steps += new_energy >= self.capacity
+        self.empty_steps += new_energy <= 0
+        return terminal_energy / self.dt * 1000
+
+    def run(self, power):
+
+        # Power requests (W) with one row per step, each row a scalar or one value per scenario,
+        # returns the applied power and the SOC after each step with one column per scenario
+        power = np.asarray(power, dtype=float)
+        applied = np.empty((power.shape[0], self.number_of_scenarios))
+        soc = np.empty((power.shape[0], self.number_of_scenarios))
+        for step in range(power.shape[0]):
+            applied[step] = self.step(power[step])
+            soc[step] = self.soc
+        return applied, soc
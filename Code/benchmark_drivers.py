@@ -0,0 +1,148 @@
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+import yaml
+import zmq
+
+sys.path.append("../")
+from Code.simulation_servers import Solar
+from Code.system_drivers import SunSpecDriver
+from Code.async_driver import AsyncSunSpecDriver
+
+
+############################ Benchmark Settings ########################################
+
+device_counts = [1, 10, 100]
+driver_modes = ["threads", "asyncio"]
+poll_interval = 0.1  # seconds
+run_time = 10  # seconds per run
+
+# Simulated servers listen from modbus_port, every device publishes on one ZeroMQ port with its own topic
+modbus_port = 15000
+publish_port = 15900
+power_port = 15999
+
+# Written to the file named on the command line when given
+output_file_name = "driver_benchmark.json"
+
+
+def load_settings():
+    with open("config_settings.yml", 'r') as yml_file:
+        return SimpleNamespace(**yaml.load(yml_file, Loader=yaml.FullLoader))
+
+
+def server_settings(settings, index):
+    return {"device_type": "TCP", "slave_id": 1, "ipaddr": "localhost", "ipport": modbus_port + index,
+            "poweraddr": 0, "read_registers": ["poweraddr"], "scale_factors": {}, "max_block_gap": 0,
+            "timeout": settings.server["solar"]["timeout"]}
+
+
+def serve_devices(number_of_devices, ready):
+
+    # One simulated solar server per device, serving 0 to 999 W
+    settings = load_settings()
+    for index in range(number_of_devices):
+        Solar([value / 1000 for value in range(1000)], SimpleNamespace(server={"solar": server_settings(settings, index)}))
+    logging.getLogger("uModbus").setLevel(logging.WARNING)
+    ready.set()
+    threading.Event().wait()
+
+
+def run_driver(driver_mode, number_of_devices, results):
+    settings = load_settings()
+    settings.ZeroMQ["battery_power_port"] = power_port
+    settings.driver["statistics_interval"] = 0
+    settings.driver["power_server"] = "device_0"
+    settings.server = {"device_" + str(index): server_settings(settings, index) for index in range(number_of_devices)}
+    settings.driver["devices"] = [{"name": "device_" + str(index), "server": "device_" + str(index),
+                                   "register": "poweraddr", "port": publish_port, "topic": index, "token": "connect",
+                                   "event_read": False, "poll_interval": poll_interval}
+                                  for index in range(number_of_devices)]
+
+    # Stands in for the control system, connects and counts the published values
+    context = zmq.Context()
+    power_socket = context.socket(zmq.PUB)
+    power_socket.bind("tcp://*:%s" % power_port)
+    value_socket = context.socket(zmq.SUB)
+    value_socket.connect("tcp://localhost:%s" % publish_port)
+    value_socket.setsockopt_string(zmq.SUBSCRIBE, "")
+
+    threads_before = threading.active_count()
+    if driver_mode == "asyncio":
+        driver = AsyncSunSpecDriver(settings)
+    else:
+        driver = SunSpecDriver(settings)
+    time.sleep(0.5)
+    power_socket.send_string("%s %s" % (settings.ZeroMQ["battery_power_topic"], "connected"))
+
+    # Waits for the connection tokens to stop and the first values to arrive
+    while value_socket.recv_multipart()[-1].endswith(b"connect"):
+        pass
+
+    # Counts values published over the run
+    published = 0
+    cpu_start = time.process_time()
+    run_start = time.time()
+    while time.time() - run_start < run_time:
+        if value_socket.poll(100):
+            value_socket.recv_multipart()
+            published += 1
+    cpu_time = time.process_time() - cpu_start
+
+    results.put({"driver_mode": driver_mode,
+                 "devices": number_of_devices,
+                 "driver_threads": threading.active_count() - threads_before,
+                 "publish_sockets": len({device["port"] for device in settings.driver["devices"]}),
+                 "published_per_second": published / run_time,
+                 "expected_per_second": number_of_devices / poll_interval,
+                 "cpu_per_value": cpu_time / published if published else None,
+                 "cpu_fraction": cpu_time / run_time})
+
+    # The driver threads never return, so the process exits once the results are sent
+    results.close()
+    results.join_thread()
+    os._exit(0)
+
+
+def run_benchmark():
+    runs = list()
+    for number_of_devices in device_counts:
+
+        # Servers run in their own process so they do not share the driver's threads or CPU time
+        ready = multiprocessing.Event()
+        servers = multiprocessing.Process(target=serve_devices, args=(number_of_devices, ready))
+        servers.start()
+        ready.wait()
+
+        for driver_mode in driver_modes:
+            results = multiprocessing.Queue()
+            driver = multiprocessing.Process(target=run_driver, args=(driver_mode, number_of_devices, results))
+            driver.start()
+            run = results.get()
+            driver.join()
+            runs.append(run)
+            print(driver_mode + ', ' + str(number_of_devices) + ' devices: threads = ' + str(run["driver_threads"])
+                  + ', sockets = ' + str(run["publish_sockets"]) + ', published = '
+                  + str(round(run["published_per_second"], 1)) + '/' + str(run["expected_per_second"]) + ' per s, '
+                  + 'CPU = ' + str(round(run["cpu_fraction"] * 100, 1)) + '%')
+
+        servers.terminate()
+        servers.join()
+    return runs
+
+
+if __name__ == '__main__':
+
+    if len(sys.argv) > 1:
+        output_file_name = sys.argv[1]
+
+    benchmark_results = run_benchmark()
+    with open(output_file_name, mode='w') as json_file:
+        json.dump(benchmark_results, json_file, indent=2)
+    print('Results written to ' + output_file_name)
@@ -0,0 +1,127 @@
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from Code.modbus_device import CONNECTION_ERRORS
+from Code.ring_buffer import RingBuffer
+
+
+class CommandQueue:
+    def __init__(self, config_settings, modbus_device, executor):
+
+        # Obtains settings from config file
+        self.settings = config_settings
+        self.max_depth = self.settings.driver["command_queue_size"]
+
+        # Commands are run by one worker from the shared executor at a time, so the device has a single owner
+        # and its reads and writes never overlap
+        self.modbus_device = modbus_device
+        self.executor = executor
+        self.commands = deque()
+        self.lock = threading.Lock()
+        self.running = False
+
+        # Latest pending setpoint and its submission time for each register, written once when its command runs
+        self.setpoints = dict()
+
+        # Queue Counters
+        self.reads = 0
+        self.writes = 0
+        self.failed_writes = 0
+        self.errors = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.max_depth_seen = 0
+        self.write_latency = RingBuffer(self.settings.driver["latency_samples"], ("latency",))
+
+    def enqueue(self, command):
+        # Returns False when the queue is full and the command is dropped
+        if len(self.commands) >= self.max_depth:
+            self.dropped += 1
+            return False
+        self.commands.append(command)
+        self.max_depth_seen = max(self.max_depth_seen, len(self.commands))
+
+        # Hands the device to a worker if none owns it
+        if not self.running:
+            self.running = True
+            self.executor.submit(self.owner)
+        return True
+
+    def read(self, callback):
+
+        # Queues a read behind any earlier writes, the callback is given the values from the worker thread
+        with self.lock:
+            return self.enqueue(("read", callback))
+
+    def set_point(self, key, value):
+
+        # Replaces a setpoint that has not been written yet, otherwise queues a write
+        with self.lock:
+            if key in self.setpoints:
+                self.setpoints[key] = [value, time.time()]
+                self.coalesced += 1
+            elif self.enqueue(("write", key)):
+                self.setpoints[key] = [value, time.time()]
+
+    def owner(self):
+
+        # Runs commands until the queue is empty, then releases the device
+        while True:
+            with self.lock:
+                if not self.commands:
+                    self.running = False
+                    return
+                command = self.commands.popleft()
+                if command[0] == "write":
+                    value, submit_time = self.setpoints.pop(command[1])
+
+            if command[0] == "read":
+                self.run_read(command[1])
+            else:
+                self.run_write(command[1], value, submit_time)
+
+    def run_read(self, callback):
+
+        # The callback is always given values, the previous ones when the read fails, so the read is never left pending
+        values = dict(self.modbus_device.values)
+        try:
+            values = self.modbus_device.read()
+            self.reads += 1
+        except Exception as error:
+            print('Error in ' + self.modbus_device.device + ' read: ' + repr(error))
+            self.errors += 1
+        finally:
+            callback(values)
+
+    def run_write(self, key, value, submit_time):
+        try:
+            self.modbus_device.write(key, value)
+        except CONNECTION_ERRORS as error:
+            print('Failed ' + self.modbus_device.device + ' write: ' + str(error))
+            self.failed_writes += 1
+            return
+        except Exception as error:
+            # e.g. a setpoint outside the signed register range, the device keeps running the queue
+            print('Error in ' + self.modbus_device.device + ' write of ' + str(value) + ': ' + repr(error))
+            self.failed_writes += 1
+            self.errors += 1
+            return
+        self.writes += 1
+        self.write_latency.append(latency=time.time() - submit_time)
+
+    def statistics(self):
+        latency = self.write_latency.view("latency")
+        return {"depth": len(self.commands),
+                "max_depth": self.max_depth_seen,
+                "reads": self.reads,
+                "writes": self.writes,
+                "failed_writes": self.failed_writes,
+                "errors": self.errors,
+                "coalesced": self.coalesced,
+                "dropped": self.dropped,
+                "last_write_latency": float(self.write_latency.latest("latency", default=0)),
+                "mean_write_latency": float(np.mean(latency)) if len(latency) else 0,
+                "max_write_latency": float(np.max(latency)) if len(latency) else 0}
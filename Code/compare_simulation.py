@@ -0,0 +1,79 @@
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append("../")
+from Code.battery_control_system import ControlSystem, Settings
+from Code.simulation_engine import SimulationEngine
+from Code.simulation_servers import Servers
+from Code.system_drivers import SunSpecDriver
+
+
+############################ Comparison Settings ########################################
+
+# Steps run on both paths, the networked path runs in real time so keep this to a day or two
+number_of_steps = 288
+result_names = ["soc", "solar", "house", "battery", "grid"]
+
+
+def headless_settings():
+    # Both paths run without plots and solve the optimiser in the control loop
+    settings = Settings()
+    settings.simulation["use_real_time"] = False
+    settings.simulation["use_visualisation"] = False
+    settings.control["background_optimiser"] = False
+    return settings
+
+
+def run_networked(steps):
+
+    # Simulation servers, drivers and control system talking over Modbus TCP and ZeroMQ
+    servers = Servers()
+    servers.start()
+    control = ControlSystem(headless_settings())
+    SunSpecDriver(control.settings)
+    control.connection_loop()
+
+    results = {name: list() for name in result_names}
+    while len(results["battery"]) < steps:
+        publish_count = control.pub.publish_count
+        control.main_loop()
+        if control.pub.publish_count != publish_count:
+            results["soc"].append(control.sub.bat_SOC)
+            results["solar"].append(control.sub.solar_power)
+            results["house"].append(control.sub.house_power)
+            results["battery"].append(control.pub.bat_power)
+            results["grid"].append(control.pub.grid)
+    return {name: np.array(values, dtype=float) for name, values in results.items()}
+
+
+def run_headless(steps):
+    engine = SimulationEngine(headless_settings())
+    results = engine.run(steps)
+    return {name: np.array(results[name], dtype=float) for name in result_names}
+
+
+if __name__ == '__main__':
+
+    if len(sys.argv) > 1:
+        number_of_steps = int(sys.argv[1])
+
+    headless_start = time.time()
+    headless = run_headless(number_of_steps)
+    headless_time = time.time() - headless_start
+
+    networked_start = time.time()
+    networked = run_networked(number_of_steps)
+    networked_time = time.time() - networked_start
+
+    print('Steps = ' + str(number_of_steps) + ', networked = ' + str(round(networked_time, 1)) + ' s, headless = '
+          + str(round(headless_time, 2)) + ' s')
+    for name in result_names:
+        difference = np.abs(networked[name] - headless[name])
+        print(name + ': max difference = ' + str(round(float(np.max(difference)), 6)) + ', steps differing = '
+              + str(int(np.sum(difference > 1e-9))))
+
+    # The servers and drivers run until the process ends
+    os._exit(0)
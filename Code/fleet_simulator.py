@@ -0,0 +1,230 @@
+# Simulates many sites, each with a battery, solar and house server, from one asyncio event loop over Modbus TCP.
+# Values follow a simulated clock rather than the number of reads, so any number of clients can poll at any rate
+
+import asyncio
+import copy
+import struct
+import sys
+import time
+
+import numpy as np
+
+sys.path.append("../")
+from Code.battery_scenarios import BatteryScenarios
+from Code.simulation_servers import Settings, load_data, served_value
+
+# Modbus TCP header: transaction id, protocol id, length and unit id
+MBAP = struct.Struct(">HHHB")
+READ_FUNCTION_CODES = (3, 4)
+WRITE_SINGLE_REGISTER = 6
+WRITE_MULTIPLE_REGISTERS = 16
+
+# Modbus exception codes
+ILLEGAL_FUNCTION = 1
+ILLEGAL_DATA_ADDRESS = 2
+GATEWAY_TARGET_FAILED = 11
+
+# Registers held by each simulated device
+DEVICE_REGISTERS = {"battery": 34, "solar": 1, "house": 1}
+
+
+def site_servers(config_settings, site):
+
+    # Server settings a driver uses to reach the devices of one site, sites share each device port by slave ID
+    # until the port is full, then move to the next group of ports
+    port_group, slave_offset = divmod(site, config_settings.fleet["sites_per_port"])
+    servers = copy.deepcopy(config_settings.server)
+    for device in DEVICE_REGISTERS:
+        servers[device]["ipport"] += port_group * config_settings.fleet["port_stride"]
+        servers[device]["slave_id"] = config_settings.fleet["first_slave_id"] + slave_offset
+    return servers
+
+
+class FleetSimulator:
+    def __init__(self, config_settings):
+
+        # Reads settings configuration file
+        self.settings = config_settings
+        self.number_of_sites = self.settings.fleet["sites"]
+        self.statistics_interval = self.settings.fleet["statistics_interval"]
+
+        # Simulated Clock, simulated seconds per real second
+        self.time_scale = self.settings.fleet["time_scale"]
+        self.data_time_step = self.settings.control["data_time_step"] * 60
+        self.start_time = None
+        self.steps = 0
+
+        # Solar and house profiles, read by row as they are served, each site is offset along the profile
+        # so the sites differ
+        self.solar_data, self.house_data = load_data(self.settings)
+        self.site_offsets = np.arange(self.number_of_sites) * self.settings.fleet["site_time_offset"]
+
+        # Batteries of every site advanced together, each holds the last power written to it (W)
+        self.batteries = BatteryScenarios.from_settings(self.settings, self.number_of_sites)
+        self.battery_power = np.zeros(self.number_of_sites, dtype=int)
+        self.soc_addr = self.settings.server["battery"]["SOCaddr"]
+        self.power_addr = self.settings.server["battery"]["poweraddr"]
+
+        # Register store of every device, one row per site
+        self.registers = {device: np.zeros((self.number_of_sites, count), dtype=int)
+                          for device, count in DEVICE_REGISTERS.items()}
+        self.registers["battery"][:, self.soc_addr] = self.batteries.soc.astype(int)
+
+        # Unit IDs above 247 are reserved
+        sites_per_port = min(self.number_of_sites, self.settings.fleet["sites_per_port"])
+        if self.settings.fleet["first_slave_id"] + sites_per_port - 1 > 247:
+            print('Fleet sites_per_port too large, slave IDs must be at most 247')
+            raise ValueError(self.settings.fleet["sites_per_port"])
+
+        # Listening address of each device, (port, unit id) of every device is mapped to its site
+        self.addresses = dict()
+        for site in range(self.number_of_sites):
+            for device, server in site_servers(self.settings, site).items():
+                if device in DEVICE_REGISTERS:
+                    self.addresses[(server["ipport"], server["slave_id"])] = (device, site)
+        self.ports = {port for port, slave_id in self.addresses}
+        self.servers = list()
+
+        # Server Counters
+        self.connections = 0
+        self.reads = 0
+        self.writes = 0
+        self.exceptions = 0
+        self.malformed_frames = 0
+
+    def simulated_time(self):
+        return (time.time() - self.start_time) * self.time_scale
+
+    def data_index(self, site):
+        # Profile row of the site at the current simulated time
+        return (int(self.simulated_time() // self.data_time_step) + self.site_offsets[site]) % len(self.solar_data)
+
+    def update_registers(self, device, site):
+        index = self.data_index(site)
+        if device == "solar":
+            self.registers["solar"][site, self.settings.server["solar"]["poweraddr"]] = \
+                served_value(self.solar_data, index)
+        elif device == "house":
+            self.registers["house"][site, self.settings.server["house"]["poweraddr"]] = \
+                served_value(self.house_data, index)
+
+    def read_registers(self, device, site, start, count):
+        if start + count > DEVICE_REGISTERS[device]:
+            return None
+        self.update_registers(device, site)
+        self.reads += 1
+        return self.registers[device][site, start:start + count]
+
+    def write_registers(self, device, site, start, values):
+        if start + len(values) > DEVICE_REGISTERS[device]:
+            return False
+        self.registers[device][site, start:start + len(values)] = values
+        if device == "battery" and start <= self.power_addr < start + len(values):
+            self.battery_power[site] = values[self.power_addr - start]
+        self.writes += 1
+        return True
+
+    def respond(self, port, unit, pdu):
+
+        # Response PDU for one request PDU
+        function_code = pdu[0]
+        if (port, unit) not in self.addresses:
+            return self.exception(function_code, GATEWAY_TARGET_FAILED)
+        device, site = self.addresses[(port, unit)]
+
+        if function_code in READ_FUNCTION_CODES:
+            start, count = struct.unpack(">HH", pdu[1:5])
+            values = self.read_registers(device, site, start, count)
+            if values is None:
+                return self.exception(function_code, ILLEGAL_DATA_ADDRESS)
+            return struct.pack(">BB%dh" % count, function_code, 2 * count, *values)
+
+        if function_code == WRITE_SINGLE_REGISTER:
+            start, value = struct.unpack(">Hh", pdu[1:5])
+            if not self.write_registers(device, site, start, [value]):
+                return self.exception(function_code, ILLEGAL_DATA_ADDRESS)
+            return pdu[:5]
+
+        if function_code == WRITE_MULTIPLE_REGISTERS:
+            start, count, byte_count = struct.unpack(">HHB", pdu[1:6])
+            if not self.write_registers(device, site, start, struct.unpack(">%dh" % count, pdu[6:6 + byte_count])):
+                return self.exception(function_code, ILLEGAL_DATA_ADDRESS)
+            return pdu[:5]
+
+        return self.exception(function_code, ILLEGAL_FUNCTION)
+
+    def exception(self, function_code, exception_code):
+        self.exceptions += 1
+        return struct.pack(">BB", function_code | 0x80, exception_code)
+
+    async def handle_client(self, reader, writer):
+
+        # Answers the requests of one connection in order until the client disconnects
+        port = writer.get_extra_info("sockname")[1]
+        self.connections += 1
+        try:
+            while True:
+                transaction, protocol, length, unit = MBAP.unpack(await reader.readexactly(MBAP.size))
+                response = self.respond(port, unit, await reader.readexactly(length - 1))
+                writer.write(MBAP.pack(transaction, protocol, len(response) + 1, unit) + response)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except (struct.error, ValueError, IndexError):
+            # A malformed or truncated frame, only this connection is closed
+            self.malformed_frames += 1
+        finally:
+            writer.close()
+
+    async def advance_batteries(self):
+
+        # Every battery moves on one data time step at each simulated step boundary
+        while True:
+            next_step = (self.steps + 1) * self.data_time_step / self.time_scale
+            await asyncio.sleep(max(0.0, self.start_time + next_step - time.time()))
+            self.batteries.step(self.battery_power)
+            self.registers["battery"][:, self.soc_addr] = self.batteries.soc.astype(int)
+            self.steps += 1
+
+    async def report_statistics(self):
+        while True:
+            await asyncio.sleep(self.statistics_interval)
+            print('Fleet: ' + str(self.number_of_sites) + ' sites, simulated time = '
+                  + str(round(self.simulated_time() / 3600, 2)) + ' h, connections = ' + str(self.connections)
+                  + ', reads = ' + str(self.reads) + ', writes = ' + str(self.writes) + ', exceptions = '
+                  + str(self.exceptions) + ', malformed frames = ' + str(self.malformed_frames) + ', mean SOC = '
+                  + str(round(float(np.mean(self.batteries.soc)), 1)) + '%')
+
+    async def serve(self):
+        self.start_time = time.time()
+        ipaddr = str(self.settings.server["battery"]["ipaddr"])
+        for port in sorted(self.ports):
+            self.servers.append(await asyncio.start_server(self.handle_client, ipaddr, port, reuse_address=True))
+        print('Serving ' + str(self.number_of_sites) + ' sites on ' + str(len(self.ports)) + ' ports')
+
+        tasks = [self.advance_batteries()]
+        if self.statistics_interval:
+            tasks.append(self.report_statistics())
+        await asyncio.gather(*tasks)
+
+    def statistics(self):
+        return {"sites": self.number_of_sites,
+                "ports": len(self.ports),
+                "simulated_time": self.simulated_time(),
+                "steps": self.steps,
+                "connections": self.connections,
+                "reads": self.reads,
+                "writes": self.writes,
+                "exceptions": self.exceptions,
+                "malformed_frames": self.malformed_frames}
+
+
+if __name__ == '__main__':
+
+    # Reads settings configuration file, the number of sites can also be given on the command line
+    settings = Settings()
+    if len(sys.argv) > 1:
+        settings.fleet["sites"] = int(sys.argv[1])
+
+    simulator = FleetSimulator(settings)
+    asyncio.run(simulator.serve())
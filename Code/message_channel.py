@@ -0,0 +1,92 @@
+import struct
+import time
+
+
+# Binary message body: value, source timestamp (seconds since the epoch) and sequence number
+MESSAGE = struct.Struct("<ddQ")
+
+
+class MessageChannel:
+    def __init__(self, config_settings, socket, topic):
+
+        # Obtains settings from config file, both ends must use the same format
+        self.settings = config_settings
+        self.binary = self.settings.ZeroMQ["binary_messages"]
+
+        # The socket and topic the channel sends or receives on
+        self.socket = socket
+        self.topic = str(topic)
+        self.topic_frame = self.topic.encode()
+
+        # Sending Sequence Number
+        self.sequence = 0
+
+        # Source time of the last value received, the receive time for text messages
+        self.last_source_time = None
+
+        # Receiving Statistics (binary messages only)
+        self.received = 0
+        self.missed = 0
+        self.last_sequence = None
+        self.last_latency = 0
+        self.max_latency = 0
+        self.total_latency = 0
+
+    def send(self, value, source_time=None):
+
+        # The source time is when the value was read, a repeated stale value keeps its original time
+        if self.binary:
+            # Multipart message of topic and packed body
+            if source_time is None:
+                source_time = time.time()
+            self.socket.send_multipart([self.topic_frame, MESSAGE.pack(value, source_time, self.sequence)])
+            self.sequence += 1
+        else:
+            self.socket.send_string("%s %d" % (self.topic, value))
+
+    def send_token(self, token):
+
+        # Connection tokens are sent as text in either format, they are never the size of a packed body
+        if self.binary:
+            self.socket.send_multipart([self.topic_frame, token.encode()])
+        else:
+            self.socket.send_string("%s %s" % (self.topic, token))
+
+    def receive(self):
+        return self.decode(self.socket.recv_multipart())
+
+    def decode(self, frames):
+
+        # Returns the value, or the token bytes for connection messages
+        if not self.binary:
+            topic, value = frames[0].split()
+            self.last_source_time = time.time()
+            return value
+
+        topic, body = frames
+        if len(body) != MESSAGE.size:
+            return body
+        value, source_time, sequence = MESSAGE.unpack(body)
+        self.last_source_time = source_time
+        self.update_statistics(source_time, sequence)
+        return value
+
+    def update_statistics(self, source_time, sequence):
+
+        # Sequence numbers skipped since the last message
+        if self.last_sequence is not None and sequence > self.last_sequence + 1:
+            self.missed += sequence - self.last_sequence - 1
+        self.last_sequence = sequence
+        self.received += 1
+
+        # End to end latency from the source timestamp
+        self.last_latency = time.time() - source_time
+        self.max_latency = max(self.max_latency, self.last_latency)
+        self.total_latency += self.last_latency
+
+    def statistics(self):
+        return {"received": self.received,
+                "missed": self.missed,
+                "last_latency": self.last_latency,
+                "max_latency": self.max_latency,
+                "mean_latency": self.total_latency / self.received if self.received else 0}
@@ -0,0 +1,141 @@
+import struct
+import time
+
+from sunspec.core.client import ClientDevice, SunSpecClientError
+from sunspec.core.modbus.client import ModbusClientError
+
+# Errors after which the connection is closed and opened again
+CONNECTION_ERRORS = (SunSpecClientError, ModbusClientError, OSError)
+
+
+class ModbusDevice:
+    def __init__(self, config_settings, device):
+
+        # Reads settings configuration file
+        self.settings = config_settings
+        self.device = device
+        self.device_settings = self.settings.server[device]
+
+        # Registers read each sample (by address key, e.g. SOCaddr) and their SunSpec scale factor registers
+        self.read_registers = self.device_settings["read_registers"]
+        self.scale_factors = self.device_settings.get("scale_factors") or dict()
+        self.max_block_gap = self.device_settings.get("max_block_gap", 0)
+
+        # Groups every address needed into as few contiguous block reads as possible
+        self.blocks = self.group_blocks()
+
+        # Latest decoded values and scale factors, kept for a failed read, and when they were requested
+        self.values = dict()
+        self.scale_factor_values = dict()
+        self.last_read_time = None
+
+        # Connection Counters
+        self.reads = 0
+        self.block_reads = 0
+        self.reconnects = 0
+        self.failed_reads = 0
+
+        # Client with one connection kept open between requests
+        self.client = self.create_client()
+        self.connected = False
+
+    def create_client(self):
+        return ClientDevice(device_type=self.device_settings["device_type"],
+                            slave_id=self.device_settings["slave_id"],
+                            ipaddr=self.device_settings["ipaddr"],
+                            ipport=self.device_settings["ipport"],
+                            timeout=self.device_settings.get("timeout"))
+
+    def addresses(self):
+        addresses = {self.device_settings[key] for key in self.read_registers}
+        addresses.update(self.scale_factors.values())
+        return sorted(addresses)
+
+    def group_blocks(self):
+
+        # (start address, register count) for runs of addresses no more than max_block_gap apart
+        blocks = list()
+        for address in self.addresses():
+            if blocks and address - (blocks[-1][0] + blocks[-1][1]) <= self.max_block_gap:
+                blocks[-1][1] = address - blocks[-1][0] + 1
+            else:
+                blocks.append([address, 1])
+        return [tuple(block) for block in blocks]
+
+    def connect(self):
+
+        # Opens the connection used by every following request (TCP devices only)
+        modbus_device = self.client.modbus_device
+        if hasattr(modbus_device, "connect"):
+            modbus_device.connect(modbus_device.timeout)
+        self.connected = True
+
+    def disconnect(self):
+        modbus_device = self.client.modbus_device
+        if hasattr(modbus_device, "disconnect"):
+            modbus_device.disconnect()
+        self.connected = False
+
+    def request(self, function, *args):
+
+        # Reconnects and retries once if the connection has dropped
+        for attempt in range(2):
+            try:
+                if self.connected is False:
+                    self.connect()
+                return function(*args)
+            except CONNECTION_ERRORS:
+                self.disconnect()
+                if attempt == 1:
+                    raise
+                self.reconnects += 1
+
+    def read(self):
+
+        # Reads every block and decodes the signed registers in one pass
+        read_start = time.time()
+        registers = dict()
+        try:
+            for start, count in self.blocks:
+                data = self.request(self.client.read, start, count)
+                for offset, value in enumerate(struct.unpack(">%dh" % count, data)):
+                    registers[start + offset] = value
+                self.block_reads += 1
+        except CONNECTION_ERRORS as error:
+            # Keeps the previous values, the connection is retried on the next read
+            print('Failed ' + self.device + ' read: ' + str(error))
+            self.failed_reads += 1
+            return dict(self.values)
+
+        self.last_read_time = read_start
+        return self.decode(registers)
+
+    def decode(self, registers):
+
+        # Applies scale factors, value x 10 ^ scale factor
+        for key, address in self.scale_factors.items():
+            self.scale_factor_values[key] = registers[address]
+        for key in self.read_registers:
+            value = registers[self.device_settings[key]]
+            if key in self.scale_factor_values:
+                value = value * 10 ** self.scale_factor_values[key]
+            self.values[key] = value
+        self.reads += 1
+        return dict(self.values)
+
+    def encode(self, key, value):
+
+        # Removes the scale factor before writing the signed register
+        if key in self.scale_factor_values:
+            value = value / 10 ** self.scale_factor_values[key]
+        return struct.pack(">h", int(value))
+
+    def write(self, key, value):
+        self.request(self.client.write, self.device_settings[key], self.encode(key, value))
+
+    def counters(self):
+        return {"reads": self.reads,
+                "block_reads": self.block_reads,
+                "blocks": len(self.blocks),
+                "reconnects": self.reconnects,
+                "failed_reads": self.failed_reads}
@@ -1,11 +1,18 @@
 
-import csv
+import collections
+import hashlib
+import multiprocessing
+import queue
 
 import numpy as np
-from pyomo.core import Var
 
 from optimiser.energy_optimiser import EnergyOptimiser, OptimiserObjectiveSet
+from optimiser.matrix_optimiser import MatrixEnergyOptimiser
+from optimiser.dp_optimiser import DynamicProgrammingOptimiser
 from optimiser.models import EnergyStorage, EnergySystem, Load, PV, Tariff
+from optimiser.solvers import in_process_solvers, solver_status
+
+from Code.profile_data import ProfileData
 
 
 class InitialPrediction:
@@ -14,21 +21,59 @@ class InitialPrediction:
         # Reads settings config file
         self.settings = config_settings
 
-        # Creates data stores
-        self.solar_data = list()
-        self.house_data = list()
-
         # Data File Names
         file_name = self.settings.control["data_file_name"]
         solar_name = self.settings.control["solar_row_name"]
         house_name = self.settings.control["house_row_name"]
 
-        # Reading CSV File
-        with open(file_name, mode='r') as csv_file:
-            csv_reader = csv.DictReader(csv_file)
-            for row in csv_reader:
-                self.solar_data.append(float(row[solar_name]))
-                self.house_data.append(float(row[house_name]))
+        # First day of the cached CSV columns, later rows are never read
+        first_day = ProfileData(self.settings, file_name, [solar_name, house_name]).window(0, 24)
+        self.solar_data = np.array(first_day[solar_name])
+        self.house_data = np.array(first_day[house_name])
+
+
+class SolutionCache:
+    def __init__(self, max_size, tolerance):
+
+        # Least recently used schedules are dropped once the cache is full
+        self.max_size = max_size
+        self.entries = collections.OrderedDict()
+
+        # Inputs within the tolerance of each other share a key
+        self.tolerance = tolerance
+
+        # Lookup Counters
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, *inputs):
+
+        # Hashes the inputs rounded to multiples of the tolerance
+        key_hash = hashlib.sha1()
+        for value in inputs:
+            quantised = np.round(np.asarray(value, dtype=float) / self.tolerance).astype(np.int64)
+            key_hash.update(quantised.tobytes())
+            key_hash.update(b'|')
+        return key_hash.hexdigest()
+
+    def get(self, key):
+        if key not in self.entries:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return self.entries[key]
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
 
 
 class Optimiser:
@@ -50,10 +95,28 @@ class Optimiser:
         # Creates Energy System and Model
         self.energy_system = EnergySystem()
         self.energy_system.add_energy_storage(self.battery)
+        self.energy_optimiser = None
         self.model = None
-        self.num_output_variables = 12
+        self.model_key = None
+        self.solver = self.settings.control["solver"]
+        self.solve_time = None
+        self.failed_solves = 0
+        self.battery_power = None
+
+        # Reuses schedules for inputs that have already been optimised
+        if self.settings.control["solution_cache"]:
+            self.solution_cache = SolutionCache(self.settings.control["cache_size"],
+                                                self.settings.control["cache_tolerance"])
+        else:
+            self.solution_cache = None
         self.time_step = self.settings.control["data_time_step"]
-        self.total_steps = (60 / self.time_step) * 24
+
+        # Sets Optimiser Horizon (fine data time steps, optionally combined into coarser blocks)
+        self.horizon_steps = int((60 / self.time_step) * self.settings.control["optimiser_horizon"])
+        self.block_lengths = None
+        self.interval_duration = None
+        self.set_horizon()
+        self.total_steps = len(self.block_lengths)
 
         # Creates Initial Optimiser Prediction (24 hours of data)
         if self.settings.control["initial_optimiser_prediction"]:
@@ -100,18 +163,18 @@ class Optimiser:
 
         self.tariff_profile = Tariff()
 
-        # Predefine Output Variables
-        self.output_vars = np.zeros((self.num_output_variables, len(export_tariff)))
-
-        # Sets Optimiser Objective
+        # Sets Optimiser Objective and Model Builder
         self.objective = None
         self.set_objective()
+        self.model_builder = None
+        self.model_options = dict()
+        self.set_model_builder()
 
         # Performs Initial Profile and Energy System Set
         self.update_profiles(self.load,
                              self.pv,
-                             self.import_tariff,
-                             self.export_tariff,
+                             list(self.import_tariff.values()),
+                             list(self.export_tariff.values()),
                              self.settings.battery["initial_SOC"])
         self.update_energy_system()
 
@@ -132,11 +195,67 @@ class Optimiser:
             print('Not a Valid Objective Setting\nSee Config File for Valid Settings')
             raise KeyError
 
+    def set_model_builder(self):
+        if self.settings.control["model_builder"] == "Pyomo":
+            self.model_builder = EnergyOptimiser
+        elif self.settings.control["model_builder"] == "Matrix":
+            self.model_builder = MatrixEnergyOptimiser
+        elif self.settings.control["model_builder"] == "DynamicProgramming":
+            # Solver-free, the solver setting is not used
+            self.model_builder = DynamicProgrammingOptimiser
+            self.model_options = {"soc_resolution": self.settings.control["dp_soc_resolution"]}
+        else:
+            print('Not a Valid Model Builder Setting\nSee Config File for Valid Settings')
+            raise KeyError
+
+        # In-process solvers are given the matrix form directly
+        if self.solver in in_process_solvers and self.model_builder is EnergyOptimiser:
+            print('The ' + self.solver + ' Solver Requires the Matrix Model Builder\nSee Config File for Valid Settings')
+            raise KeyError
+
+        # Only the matrix form and the dynamic program support intervals of differing durations
+        if self.settings.control["multi_resolution"] and self.model_builder is EnergyOptimiser:
+            print('Multi-Resolution Horizons Require the Matrix or DynamicProgramming Model Builder\nSee Config File for Valid Settings')
+            raise KeyError
+
+    def set_horizon(self):
+        if self.settings.control["multi_resolution"]:
+            # Data time steps for the first hours, then coarser blocks for the rest of the horizon
+            fine_steps = min(int((60 / self.time_step) * self.settings.control["fine_horizon"]), self.horizon_steps)
+            block_steps = int(self.settings.control["coarse_time_step"] / self.time_step)
+            if block_steps < 1:
+                print('The Coarse Time Step Must be at Least the Data Time Step\nSee Config File for Valid Settings')
+                raise KeyError
+            if self.settings.control["coarse_time_step"] % self.time_step != 0:
+                print('The Coarse Time Step Must be a Multiple of the Data Time Step\nSee Config File for Valid Settings')
+                raise KeyError
+            coarse_steps = self.horizon_steps - fine_steps
+            block_lengths = [1] * fine_steps + [block_steps] * (coarse_steps // block_steps)
+            if coarse_steps % block_steps:
+                block_lengths.append(coarse_steps % block_steps)
+            self.block_lengths = np.array(block_lengths)
+            self.interval_duration = self.block_lengths * self.time_step
+        else:
+            self.block_lengths = np.ones(self.horizon_steps, dtype=int)
+            self.interval_duration = self.time_step
+
+    def aggregate_profile(self, profile, average=False):
+
+        # Repeats the daily profile over the horizon
+        profile = np.resize(np.asarray(profile, dtype=float), self.horizon_steps)
+
+        # Energies are summed over each block, prices are averaged
+        block_starts = np.cumsum(self.block_lengths) - self.block_lengths
+        aggregated = np.add.reduceat(profile, block_starts)
+        if average:
+            aggregated /= self.block_lengths
+        return aggregated
+
     def update_profiles(self, load, pv, imp, exp, soc):
-        self.load_profile.add_load_profile(load)
-        self.pv_profile.add_pv_profile(pv)
-        self.tariff_profile.add_tariff_profile_import(dict(enumerate(imp)))
-        self.tariff_profile.add_tariff_profile_export(dict(enumerate(exp)))
+        self.load_profile.add_load_profile(self.aggregate_profile(load))
+        self.pv_profile.add_pv_profile(self.aggregate_profile(pv))
+        self.tariff_profile.add_tariff_profile_import(dict(enumerate(self.aggregate_profile(imp, average=True))))
+        self.tariff_profile.add_tariff_profile_export(dict(enumerate(self.aggregate_profile(exp, average=True))))
         self.battery.initial_state_of_charge = soc / (100 / self.battery.max_capacity)
 
     def update_energy_system(self):
@@ -144,24 +263,161 @@ class Optimiser:
         self.energy_system.add_pv(self.pv_profile)
         self.energy_system.add_tariff(self.tariff_profile)
 
+    def solution_key(self):
+
+        # Everything the schedule depends on
+        battery = self.battery
+        return self.solution_cache.key(self.load_profile.load,
+                                       self.pv_profile.pv,
+                                       list(self.tariff_profile.import_tariff.values()),
+                                       list(self.tariff_profile.export_tariff.values()),
+                                       battery.initial_state_of_charge,
+                                       [battery.max_capacity, battery.depth_of_discharge_limit,
+                                        battery.charging_power_limit, battery.discharging_power_limit,
+                                        battery.charging_efficiency, battery.discharging_efficiency,
+                                        battery.throughput_cost],
+                                       self.objective,
+                                       self.block_lengths)
+
     def optimise(self):
 
-        optimiser = EnergyOptimiser(self.time_step, self.total_steps, self.energy_system, self.objective)
-        self.model = optimiser.model
+        # Returns False and keeps the previous schedule when the solver does not solve the problem
+        # Returns a cached schedule without solving when the inputs have been seen before
+        if self.solution_cache is not None:
+            key = self.solution_key()
+            battery_power = self.solution_cache.get(key)
+            if battery_power is not None:
+                self.battery_power = battery_power
+                self.solve_time = 0.0
+                print('Optimiser reused a cached schedule (hit rate '
+                      + str(round(self.solution_cache.hit_rate * 100, 1)) + '%)')
+                return True
+
+        # A persistent model is only rebuilt when the horizon length or objective set changes
+        model_key = (self.total_steps, tuple(self.objective))
+        if self.settings.control["persistent_model"] and self.model_key == model_key:
+            self.energy_optimiser.update_energy_system(self.energy_system)
+            self.energy_optimiser.optimise()
+        else:
+            self.energy_optimiser = self.model_builder(self.interval_duration, self.total_steps, self.energy_system,
+                                                       self.objective, optimiser_engine=self.solver,
+                                                       **self.model_options)
+            self.model_key = model_key
+        self.model = self.energy_optimiser.model
+
+        self.solve_time = self.energy_optimiser.solve_time
+
+        # Calculate total new battery power over the horizon
+        results = self.energy_optimiser.extract_results()
+        if results is None:
+            print('Optimiser not solved (' + solver_status(self.energy_optimiser.results)
+                  + '), keeping the previous schedule')
+            self.failed_solves += 1
+            return False
+        storage_energy_delta = results.storage_energy_delta
+
+        # Spreads each block evenly over its data time steps, so the schedule is indexed by control step
+        self.battery_power = np.repeat(storage_energy_delta / self.block_lengths, self.block_lengths)
+
+        if self.solution_cache is not None:
+            self.solution_cache.put(key, self.battery_power)
+        return True
+
+    def solver_name(self):
+        # The dynamic program does not use the solver setting
+        if self.model_builder is DynamicProgrammingOptimiser:
+            return "dynamic programming"
+        return self.solver
 
     def return_battery_power(self):
+        return np.copy(self.battery_power)
+
 
-        # Extract Optimiser Results
-        j = 0
-        for v in self.model.component_objects(Var, active=True):
-            var_object = getattr(self.model, str(v))
-            for index in var_object:
-                self.output_vars[j, index] = var_object[index].value
-            j += 1
-            if j >= self.num_output_variables:
-                break
+def run_optimiser_worker(config_settings, snapshot_queue, result_queue):
 
-        # Calculate total new battery power over 24 hours
-        storage_energy_delta = self.output_vars[3] + self.output_vars[4] + self.output_vars[5] + self.output_vars[6]
-        return storage_energy_delta
+    # Builds its own optimiser so that solving never blocks the control loop
+    optimiser = Optimiser(config_settings)
+
+    while True:
+        snapshot = snapshot_queue.get()
+        if snapshot is None:
+            break
+
+        # Optimises the snapshot and returns the schedule with the time it was taken and the solve time
+        optimiser.update_profiles(snapshot["load"],
+                                  snapshot["pv"],
+                                  snapshot["import_tariff"],
+                                  snapshot["export_tariff"],
+                                  snapshot["soc"])
+        optimiser.update_energy_system()
+        if optimiser.optimise():
+            result_queue.put((snapshot["time"], optimiser.return_battery_power(), optimiser.solve_time))
+        else:
+            result_queue.put((snapshot["time"], None, optimiser.solve_time))
+
+
+class BackgroundOptimiser:
+    def __init__(self, config_settings):
+
+        # Reads settings config file
+        self.settings = config_settings
 
+        # Only one snapshot is solved at a time
+        self.busy = False
+
+        # Time taken by the worker to solve the last snapshot (seconds)
+        self.solve_time = None
+
+        # Starts Worker Process, restarted if it dies
+        self.snapshot_queue = None
+        self.result_queue = None
+        self.process = None
+        self.restarts = 0
+        self.start_worker()
+
+    def start_worker(self):
+
+        # Fresh queues, so a snapshot left by a dead worker is not solved late
+        self.snapshot_queue = multiprocessing.Queue()
+        self.result_queue = multiprocessing.Queue()
+        self.process = multiprocessing.Process(target=run_optimiser_worker,
+                                               args=(self.settings, self.snapshot_queue, self.result_queue))
+        self.process.daemon = True
+        self.process.start()
+
+    def submit(self, load, pv, imp, exp, soc, snapshot_time):
+
+        # Skips the request if the previous snapshot is still being solved
+        if self.busy:
+            return False
+
+        self.snapshot_queue.put({"load": np.array(load),
+                                 "pv": np.array(pv),
+                                 "import_tariff": np.array(imp),
+                                 "export_tariff": np.array(exp),
+                                 "soc": soc,
+                                 "time": snapshot_time})
+        self.busy = True
+        return True
+
+    def poll(self):
+
+        # Returns the latest (snapshot time, battery power) result without blocking, power is None when not solved
+        try:
+            result = self.result_queue.get_nowait()
+        except queue.Empty:
+            # A worker that died mid-solve never returns a result, so it is restarted for the next snapshot
+            if self.busy and not self.process.is_alive():
+                print('Optimiser worker stopped (exit code ' + str(self.process.exitcode)
+                      + '), restarting it, the current schedule is kept')
+                self.restarts += 1
+                self.busy = False
+                self.start_worker()
+            return None
+        self.busy = False
+        snapshot_time, battery_power, self.solve_time = result
+        return snapshot_time, battery_power
+
+    def stop(self):
+        self.snapshot_queue.put(None)
+        self.process.join()
@@ -0,0 +1,161 @@
+import csv
+import itertools
+import multiprocessing
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append("../")
+from Code.battery_control_system import Settings
+from Code.simulation_engine import SimulationEngine
+
+
+############################ Sweep Settings ########################################
+
+# Each axis maps a scenario label to the config overrides ("section.key": value) it applies,
+# every combination of one label per axis is run, optimiser scenarios turn PV self consumption off
+# so they are not blended with it
+sweep_axes = [
+    {"Data Set 1": {"simulation.data_file_name": "random_data_set.csv"},
+     "Summer Set": {"simulation.data_file_name": "summer_data_set.csv"},
+     "Winter Set": {"simulation.data_file_name": "winter_data_set.csv"}},
+    {str(capacity) + "kWh": {"battery.max_capacity": capacity} for capacity in [2, 4, 6, 8, 10, 12, 15]},
+    {"PVSC": {"control.optimiser": False, "control.pv_self_cons": True},
+     "FEP": {"control.optimiser": True, "control.pv_self_cons": False, "control.objective": "FEP",
+             "control.model_builder": "Matrix", "control.solver": "clarabel"}},
+]
+
+# Days simulated per scenario, worker processes (None for one per CPU)
+number_of_days = 7
+processes = None
+
+# Results table and traces are written to the directory named on the command line when given,
+# plots of the last simulated day are saved afterwards when enabled ("plot" on the command line replots only)
+output_dir = "sweep_results"
+results_file_name = "results.csv"
+traces_file_name = "traces.npz"
+save_plots = False
+trace_names = ["time", "soc", "solar", "house", "battery", "grid"]
+
+
+def scenarios():
+
+    # Label and merged overrides of every combination of the sweep axes
+    for combination in itertools.product(*[axis.items() for axis in sweep_axes]):
+        labels = [label for label, overrides in combination]
+        overrides = dict()
+        for label, axis_overrides in combination:
+            overrides.update(axis_overrides)
+        yield labels, overrides
+
+
+def scenario_name(labels):
+    return "_".join(label.replace(" ", "") for label in labels)
+
+
+def apply_overrides(config_settings, overrides):
+    for key, value in overrides.items():
+        section, name = key.split(".", 1)
+        getattr(config_settings, section)[name] = value
+
+
+def run_scenario(scenario):
+    labels, overrides, scenario_dir = scenario
+
+    # Each scenario writes its own telemetry file in the output directory
+    settings = Settings()
+    apply_overrides(settings, overrides)
+    settings.telemetry["file_name"] = os.path.join(scenario_dir, scenario_name(labels) + "_values")
+    settings.telemetry["rotate_daily"] = False
+
+    # Runs the control system on simulated time
+    run_start = time.time()
+    engine = SimulationEngine(settings)
+    steps = int(number_of_days * 24 * 3600 / engine.time_step)
+    traces = engine.run(steps)
+    engine.control.sub.telemetry.stop()
+
+    result = {"scenario": scenario_name(labels)}
+    result.update({"axis_" + str(index): label for index, label in enumerate(labels)})
+    result.update(engine.summary())
+    result["run_time"] = time.time() - run_start
+    return result, {name: traces[name].astype(float) for name in trace_names}
+
+
+def run_sweep():
+    sweep = [(labels, overrides, output_dir) for labels, overrides in scenarios()]
+    print('Running ' + str(len(sweep)) + ' scenarios of ' + str(number_of_days) + ' days')
+
+    # Scenarios are independent, results are collected in sweep order as they finish
+    results = list()
+    traces = dict()
+    with multiprocessing.Pool(processes) as pool:
+        for result, scenario_traces in pool.imap(run_scenario, sweep):
+            print(result["scenario"] + ': saved = $' + str(round(result["savings"], 2)) + ', battery saved = $'
+                  + str(round(result["battery_savings"], 2)) + ' (' + str(round(result["run_time"], 1)) + ' s)')
+            results.append(result)
+            for name, values in scenario_traces.items():
+                traces[result["scenario"] + "/" + name] = values
+    return results, traces
+
+
+def write_results(results, traces):
+    with open(os.path.join(output_dir, results_file_name), mode='w', newline='') as csv_file:
+        csv_writer = csv.DictWriter(csv_file, fieldnames=list(results[0].keys()))
+        csv_writer.writeheader()
+        csv_writer.writerows(results)
+    np.savez_compressed(os.path.join(output_dir, traces_file_name), **traces)
+
+
+def plot_results():
+    import matplotlib.pyplot as plt
+    plt.switch_backend("Agg")
+
+    # One plot per scenario of the last simulated day, drawn as the control system displays it
+    traces = np.load(os.path.join(output_dir, traces_file_name))
+    names = sorted({key.split("/")[0] for key in traces.files})
+    for name in names:
+        hours = traces[name + "/time"]
+        day_starts = np.flatnonzero(np.diff(hours) < 0) + 1
+        day = slice(day_starts[-1] if day_starts.size else 0, None)
+        hours = hours[day]
+
+        plt.figure(figsize=[12, 7])
+        plt.axis([0, 24, -6, 8])
+        plt.title(name)
+        plt.xlabel('Time (Hours)')
+        plt.ylabel('Power (kW)')
+        plt.grid(True)
+        soc_ref = plt.hlines(6, 0, 24, linestyles='dashed')
+        soc_ref.set_label('100% State of Charge')
+        plt.plot(hours, traces[name + "/soc"][day] / (100 / 6), '-o', alpha=0.8, c='y', markersize=2,
+                 label='State of Charge')
+        plt.plot(hours, traces[name + "/grid"][day] / 1000, '-o', alpha=0.8, c='m', markersize=2, label='Grid Power')
+        plt.plot(hours, traces[name + "/battery"][day] / 1000, '-o', alpha=0.8, c='g', markersize=2,
+                 label='Battery Power')
+        plt.plot(hours, traces[name + "/house"][day] / 1000, '-o', alpha=0.8, c='b', markersize=2,
+                 label='House Power')
+        plt.plot(hours, traces[name + "/solar"][day] / 1000, '-o', alpha=0.8, c='r', markersize=2,
+                 label='Solar Power')
+        plt.legend()
+        plt.savefig(os.path.join(output_dir, name + ".png"))
+        plt.close()
+    print('Plots saved to ' + output_dir)
+
+
+if __name__ == '__main__':
+
+    if len(sys.argv) > 1:
+        output_dir = sys.argv[1]
+    if len(sys.argv) > 2 and sys.argv[2] == "plot":
+        plot_results()
+        sys.exit()
+
+    os.makedirs(output_dir, exist_ok=True)
+    sweep_results, sweep_traces = run_sweep()
+    write_results(sweep_results, sweep_traces)
+    print('Results written to ' + os.path.join(output_dir, results_file_name))
+    if save_plots:
+        plot_results()
@@ -0,0 +1,132 @@
+import csv
+import hashlib
+import os
+
+import numpy as np
+
+
+class ProfileData:
+    def __init__(self, config_settings, file_name, columns):
+
+        # Obtains settings from config file
+        self.settings = config_settings
+        self.file_name = file_name
+        self.columns = list(columns)
+        self.cache_enabled = self.settings.data_cache["enabled"]
+        self.cache_dir = self.settings.data_cache["directory"]
+        self.chunk_rows = self.settings.data_cache["chunk_rows"]
+
+        # Rows per hour of the profile data
+        self.rows_per_hour = 60 / self.settings.control["data_time_step"]
+
+        # Column arrays, memory-mapped from the cache so rows are only read from disk when used
+        self.data = None
+        self.cache_hit = False
+        self.load()
+
+    def source_key(self):
+
+        # Identifies the CSV file and the columns read from it
+        key_hash = hashlib.sha1()
+        key_hash.update(os.path.abspath(self.file_name).encode())
+        for column in self.columns:
+            key_hash.update(b'|' + column.encode())
+        return key_hash.hexdigest()[:12]
+
+    def version_key(self):
+
+        # Changes whenever the CSV file is modified
+        file_stat = os.stat(self.file_name)
+        return hashlib.sha1((str(file_stat.st_mtime_ns) + "|" + str(file_stat.st_size)).encode()).hexdigest()[:12]
+
+    def cache_prefix(self):
+        return os.path.splitext(os.path.basename(self.file_name))[0] + "_" + self.source_key() + "_"
+
+    def cache_files(self):
+        prefix = self.cache_prefix() + self.version_key() + "_"
+        return {column: os.path.join(self.cache_dir, prefix + str(index) + ".npy")
+                for index, column in enumerate(self.columns)}
+
+    def load(self):
+        if not self.cache_enabled:
+            self.data = self.parse_rows()
+            return
+
+        # Reuses the cached columns when every one exists for this version of the file
+        cache_files = self.cache_files()
+        if all(os.path.exists(path) for path in cache_files.values()):
+            self.data = {column: np.load(path, mmap_mode='r') for column, path in cache_files.items()}
+            self.cache_hit = True
+            return
+
+        # Otherwise parses the file once straight into the cache files, older versions of the file are removed
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self.remove_stale_files(cache_files)
+            data = self.parse_rows(cache_files)
+            for column, array in data.items():
+                array.flush()
+                os.replace(array.filename, cache_files[column])
+        except OSError as error:
+            print('Data cache not written (' + str(error) + '), reading ' + self.file_name + ' into memory')
+            self.data = self.parse_rows()
+            return
+        self.data = {column: np.load(path, mmap_mode='r') for column, path in cache_files.items()}
+
+    def remove_stale_files(self, cache_files):
+
+        # Only older versions of the same file and columns, other files and column sets keep their caches
+        prefix = self.cache_prefix()
+        current = {os.path.basename(path) for path in cache_files.values()}
+        for name in os.listdir(self.cache_dir):
+            if name.startswith(prefix) and name.endswith(".npy") and name not in current:
+                os.remove(os.path.join(self.cache_dir, name))
+
+    def count_rows(self):
+        with open(self.file_name, mode='r') as csv_file:
+            return max(sum(1 for line in csv_file if line.strip()) - 1, 0)
+
+    def parse_rows(self, cache_files=None):
+
+        # Columns are written to temporary cache files for this process, renamed once complete so a partial file
+        # is never loaded, or held in memory when not caching
+        number_of_rows = self.count_rows()
+        if cache_files is None:
+            data = {column: np.empty(number_of_rows) for column in self.columns}
+        else:
+            data = {column: np.lib.format.open_memmap(cache_files[column] + "." + str(os.getpid()) + ".tmp",
+                                                      mode='w+', dtype=np.float64, shape=(number_of_rows,))
+                    for column in self.columns}
+
+        # Reads the CSV file in chunks of rows, only the configured columns are converted
+        with open(self.file_name, mode='r') as csv_file:
+            csv_reader = csv.reader(line for line in csv_file if line.strip())
+            header = next(csv_reader)
+            for column in self.columns:
+                if column not in header:
+                    print('Column ' + column + ' not found in ' + self.file_name)
+                    raise KeyError(column)
+            indices = [header.index(column) for column in self.columns]
+
+            row_index = 0
+            while row_index < number_of_rows:
+                chunk = [row for row, _ in zip(csv_reader, range(self.chunk_rows))]
+                if not chunk:
+                    break
+                for column, index in zip(self.columns, indices):
+                    data[column][row_index:row_index + len(chunk)] = [float(row[index]) for row in chunk]
+                row_index += len(chunk)
+        return data
+
+    def __len__(self):
+        return len(self.data[self.columns[0]]) if self.columns else 0
+
+    def column(self, column):
+        return self.data[column]
+
+    def window(self, start_hour, hours):
+
+        # Rows of every column from start_hour for the number of hours, views of the cached arrays
+        start = int(round(start_hour * self.rows_per_hour))
+        stop = start + int(round(hours * self.rows_per_hour))
+        return {column: values[start:stop] for column, values in self.data.items()}
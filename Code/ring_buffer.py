@@ -0,0 +1,69 @@
+import numpy as np
+
+
+class RingBuffer:
+    def __init__(self, capacity, columns, dtype=float):
+
+        # Holds the last capacity rows of each column, older rows are overwritten
+        self.capacity = int(capacity)
+        self.columns = tuple(columns)
+        self.count = 0
+
+        # Every row is written twice, capacity apart, so the retained rows are always contiguous
+        # and can be returned as views without copying
+        self.data = {name: np.zeros(2 * self.capacity, dtype=dtype) for name in self.columns}
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def __bool__(self):
+        return self.count > 0
+
+    def append(self, **row):
+        position = self.count % self.capacity
+        for name in self.columns:
+            column = self.data[name]
+            column[position] = row[name]
+            column[position + self.capacity] = row[name]
+        self.count += 1
+
+    def end(self):
+        # One past the newest row in the doubled arrays
+        return (self.count - 1) % self.capacity + self.capacity + 1
+
+    def view(self, name, start=0):
+
+        # Retained rows oldest first, start is a sample number counted from the first ever appended
+        end = self.end() if self.count else 0
+        first_sample = self.count - len(self)
+        return self.data[name][end - len(self) + max(start - first_sample, 0):end]
+
+    def latest(self, name, back=0, default=None):
+
+        # The value back rows before the newest, in constant time
+        if back >= len(self):
+            return default
+        return self.data[name][self.end() - 1 - back]
+
+
+class TimeSeriesStore(RingBuffer):
+    def __init__(self, capacity, columns, period=24):
+
+        # Times wrap each period (hours of the day), an elapsed time column keeps the rows in order
+        super().__init__(capacity, ("time", "elapsed") + tuple(columns))
+        self.period = period
+        self.period_offset = 0
+
+    def append(self, **row):
+        previous = self.latest("time")
+        if previous is not None and row["time"] < previous:
+            self.period_offset += self.period
+        row["elapsed"] = self.period_offset + row["time"]
+        super().append(**row)
+
+    def between(self, name, start_elapsed, end_elapsed):
+
+        # Rows with start_elapsed <= elapsed < end_elapsed, as a view
+        elapsed = self.view("elapsed")
+        first, last = np.searchsorted(elapsed, [start_elapsed, end_elapsed])
+        return self.view(name)[first:last]
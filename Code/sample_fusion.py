@@ -0,0 +1,122 @@
+from collections import deque
+
+import numpy as np
+
+
+class SampleFusion:
+    def __init__(self, config_settings, devices):
+
+        # Obtains settings from config file
+        self.settings = config_settings
+        self.devices = list(devices)
+        self.reference = self.settings.fusion["reference"]
+        self.lateness_window = self.settings.fusion["lateness_window"]
+        self.match_window = self.settings.fusion["match_window"]
+        self.interpolate = self.settings.fusion["fill"] == "interpolate"
+
+        # Recent samples of each device as [source time, value, used], oldest first
+        self.samples = {device: deque() for device in self.devices}
+        self.buffer_size = self.settings.fusion["buffer_size"]
+
+        # Reference sample times waiting to be emitted as ticks, and the last emitted tick
+        self.ticks = deque()
+        self.last_tick = None
+
+        # Last value of each device, used before a device has sent any sample
+        self.last_values = {device: 0 for device in self.devices}
+
+        # Fusion Counters
+        self.records = 0
+        self.late = 0
+        self.dropped = 0
+        self.interpolated = 0
+        self.carried_forward = 0
+
+    def add(self, device, source_time, value):
+
+        # A sample at or before the last emitted tick arrived too late to be used, counted only as late
+        if self.last_tick is not None and source_time <= self.last_tick:
+            self.late += 1
+            return
+
+        samples = self.samples[device]
+        samples.append([source_time, value, False])
+        if len(samples) > self.buffer_size:
+            if not samples.popleft()[2]:
+                self.dropped += 1
+
+        if device == self.reference:
+            self.ticks.append(source_time)
+
+    def complete(self, tick):
+        # Every device has a sample at or after the tick, within the match window, that no earlier record has used
+        return all(samples and samples[-1][0] >= tick - self.match_window and not samples[-1][2]
+                   for samples in self.samples.values())
+
+    def value_at(self, device, tick):
+        samples = self.samples[device]
+        if not samples:
+            return self.last_values[device]
+
+        times = np.array([sample[0] for sample in samples])
+
+        # Unused sample closest to the tick, if it is within the match window
+        distance = np.where([not sample[2] for sample in samples], np.abs(times - tick), np.inf)
+        closest = int(np.argmin(distance))
+        if distance[closest] <= self.match_window:
+            samples[closest][2] = True
+            return samples[closest][1]
+
+        # Samples either side of the tick
+        after = int(np.searchsorted(times, tick))
+        if after == 0:
+            # Only later samples, the earliest is carried back
+            self.carried_forward += 1
+            samples[0][2] = True
+            return samples[0][1]
+        before = samples[after - 1]
+        before[2] = True
+        if self.interpolate and after < len(samples):
+            following = samples[after]
+            following[2] = True
+            self.interpolated += 1
+            return before[1] + (following[1] - before[1]) * (tick - before[0]) / (following[0] - before[0])
+        self.carried_forward += 1
+        return before[1]
+
+    def discard_before(self, tick):
+
+        # Keeps the newest sample at or before the tick for filling the next record
+        for samples in self.samples.values():
+            while len(samples) > 1 and samples[1][0] <= tick:
+                if not samples.popleft()[2]:
+                    self.dropped += 1
+
+    def ready(self, now):
+
+        # Aligned records for every tick that is complete or has waited the lateness window
+        records = list()
+        while self.ticks and (self.complete(self.ticks[0]) or now - self.ticks[0] >= self.lateness_window):
+            tick = self.ticks.popleft()
+            record = {device: self.value_at(device, tick) for device in self.devices}
+            self.last_values.update(record)
+            self.discard_before(tick)
+            self.last_tick = tick
+            self.records += 1
+            records.append((tick, record))
+        return records
+
+    def time_to_deadline(self, now):
+
+        # Seconds until the oldest waiting tick must be emitted, None when no tick is waiting
+        if not self.ticks:
+            return None
+        return max(0.0, self.ticks[0] + self.lateness_window - now)
+
+    def counters(self):
+        return {"records": self.records,
+                "late": self.late,
+                "dropped": self.dropped,
+                "interpolated": self.interpolated,
+                "carried_forward": self.carried_forward,
+                "waiting": len(self.ticks)}
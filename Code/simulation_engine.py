@@ -0,0 +1,121 @@
+import sys
+import time
+
+import numpy as np
+
+sys.path.append("../")
+from Code.battery_control_system import ControlSystem, Settings
+from Code.simulation_servers import BatteryModel, load_data, served_value
+
+
+############################ Simulation Settings ########################################
+
+# Days simulated when run as a script, the number of days can also be given on the command line
+number_of_days = 7
+
+
+class SimulationEngine:
+    def __init__(self, config_settings):
+
+        # Reads settings configuration file, the engine runs headless in simulated time and solves the optimiser
+        # in the control loop (as the networked path does when only reading after each power write)
+        self.settings = config_settings
+        self.settings.simulation["use_real_time"] = False
+        self.settings.simulation["use_visualisation"] = False
+        self.settings.control["background_optimiser"] = False
+
+        # Battery SOC model and the CSV data served by the simulation servers, read one row per step
+        self.battery = BatteryModel(self.settings)
+        self.solar_data, self.house_data = load_data(self.settings)
+        self.data_count = 0
+
+        # Simulated Clock (seconds), advanced one data time step per sample set
+        self.clock = 0.0
+        self.time_step = self.settings.simulation["time_step"] * 60
+
+        # Control System without sockets, values are passed straight to its subscriber
+        self.control = ControlSystem(self.settings, connect=False)
+        self.control.sub.initial_time = round(time.time(), 2)
+        self.control.pub.initial_time = self.control.sub.initial_time
+        self.control.connected = True
+
+        # Results, one entry per step
+        self.results = {"time": list(), "soc": list(), "solar": list(), "house": list(), "battery": list(),
+                        "grid": list()}
+
+    def read_devices(self):
+
+        # The values the driver reads after each power write, the solar and house servers move on one sample per read
+        values = {"soc": self.battery.register_value(),
+                  "solar": served_value(self.solar_data, self.data_count),
+                  "house": served_value(self.house_data, self.data_count)}
+        if self.data_count == len(self.solar_data) - 1:
+            self.data_count = 0
+        else:
+            self.data_count += 1
+        return values
+
+    def step(self):
+        sub = self.control.sub
+        pub = self.control.pub
+
+        # Subscribing, every value is read at the current simulated time
+        for device, value in self.read_devices().items():
+            sub.process_value(device, value, self.clock)
+        sub.emit_samples(self.clock)
+
+        # Control System Main Loop
+        publish_count = pub.publish_count
+        self.control.main_loop()
+
+        # The published power is written to the battery in whole W, as it is by the driver
+        if pub.publish_count != publish_count:
+            self.battery.predict_soc(int(pub.bat_power))
+
+        self.results["time"].append(self.control.current_time())
+        self.results["soc"].append(sub.bat_SOC)
+        self.results["solar"].append(sub.solar_power)
+        self.results["house"].append(sub.house_power)
+        self.results["battery"].append(pub.bat_power)
+        self.results["grid"].append(pub.grid)
+        self.clock += self.time_step
+
+    def run(self, number_of_steps):
+        for step in range(number_of_steps):
+            self.step()
+        return {name: np.array(values) for name, values in self.results.items()}
+
+    def summary(self):
+        pub = self.control.pub
+        return {"steps": len(self.results["time"]),
+                "days": self.control.sub.day_count,
+                "savings": pub.house_import - pub.savings,
+                "battery_savings": pub.sol_savings - pub.savings,
+                "house_import": pub.house_import,
+                "house_energy": self.control.house_energy,
+                "solar_energy": self.control.solar_energy,
+                "final_soc": self.battery.SOC}
+
+
+if __name__ == '__main__':
+
+    if len(sys.argv) > 1:
+        number_of_days = float(sys.argv[1])
+
+    # Reads settings configuration file and runs the control system on simulated time
+    engine = SimulationEngine(Settings())
+    steps = int(number_of_days * 24 * 3600 / engine.time_step)
+    run_start = time.time()
+    engine.run(steps)
+    run_time = time.time() - run_start
+    engine.control.sub.telemetry.stop()
+
+    summary = engine.summary()
+    print('Simulated ' + str(number_of_days) + ' days (' + str(steps) + ' steps) in ' + str(round(run_time, 1))
+          + ' s, ' + str(round(number_of_days * 24 * 3600 / run_time)) + 'x real time')
+    print('Total PV system money saved = $' + str(round(summary["savings"], 2)))
+    print('Additional money saved by battery = $' + str(round(summary["battery_savings"], 2)))
+    print('Total cost of load import = $' + str(round(summary["house_import"], 2)))
+    print('Total load energy = ' + str(round(summary["house_energy"], 2)) + ' kWh')
+    print('Total solar energy = ' + str(round(summary["solar_energy"], 2)) + ' kWh')
+    print('Final SOC = ' + str(round(summary["final_soc"], 2)) + '%')
@@ -8,7 +8,7 @@ TCP function codes:
     16 = write multiple holding registers
 """
 
-import csv
+import sys
 import yaml
 import logging
 import threading
@@ -19,6 +19,9 @@ from umodbus import conf
 from umodbus.server.tcp import RequestHandler, get_server
 from umodbus.utils import log_to_stream
 
+sys.path.append("../")
+from Code.profile_data import ProfileData
+
 
 class Settings:
     def __init__(self):
@@ -28,11 +31,46 @@ class Settings:
             setattr(self, k, v)
 
 
-class Battery:
+class BatteryModel:
     def __init__(self, config_settings):
 
         # Reads settings configuration file
         self.settings = config_settings
+
+        # Sets Initial Values
+        self.initial_soc = self.settings.battery["initial_SOC"]
+        self.SOC = self.initial_soc
+
+        self.dt = self.settings.control["data_time_step"] / 60
+        self.bat_cap = self.settings.battery["max_capacity"] * 1000
+
+    def register_value(self):
+        # SOC as held in the server register
+        return int(self.SOC)
+
+    def set_value(self, new_soc):
+        self.SOC = new_soc
+
+    def predict_soc(self, power):
+        old_soc = self.SOC
+        new_soc = old_soc + ((power/self.bat_cap)*self.dt)*100
+
+        if new_soc > 100:
+            print('SOC at 100%')
+            new_soc = 100
+
+        elif new_soc < 0:
+            print('SOC at 0%')
+            new_soc = 0
+
+        self.set_value(new_soc)
+
+
+class Battery(BatteryModel):
+    def __init__(self, config_settings):
+
+        # Reads settings configuration file and sets the initial SOC
+        super().__init__(config_settings)
         self.SOC_addr = self.settings.server["battery"]["SOCaddr"]
         self.power_addr = self.settings.server["battery"]["poweraddr"]
         self.slave_id = self.settings.server["battery"]["slave_id"]
@@ -68,31 +106,12 @@ class Battery:
         self.thread = threading.Thread(target=self._thread)
         self.thread.start()
 
-        # Sets Initial Values
-        self.initial_soc = self.settings.battery["initial_SOC"]
-        self.SOC = self.initial_soc
-        self.data_store[self.SOC_addr] = self.initial_soc
-
-        self.dt = self.settings.control["data_time_step"] / 60
-        self.bat_cap = self.settings.battery["max_capacity"] * 1000
+        # Sets Initial Register Value
+        self.data_store[self.SOC_addr] = self.register_value()
 
     def set_value(self, new_soc):
-        self.SOC = new_soc
-        self.data_store[self.SOC_addr] = int(new_soc)
-
-    def predict_soc(self, power):
-        old_soc = self.SOC
-        new_soc = old_soc + ((power/self.bat_cap)*self.dt)*100
-
-        if new_soc > 100:
-            print('SOC at 100%')
-            new_soc = 100
-
-        elif new_soc < 0:
-            print('SOC at 0%')
-            new_soc = 0
-
-        self.set_value(new_soc)
+        super().set_value(new_soc)
+        self.data_store[self.SOC_addr] = self.register_value()
 
     def _thread(self):
         try:
@@ -135,7 +154,7 @@ class Solar:
         # Server read function
         @self.app.route(slave_ids=[self.slave_id], function_codes=[3, 4], addresses=list(range(0, 1)))
         def read_data_store(slave_id, function_code, address):
-            self.data_store[self.power_addr] = self.solar_data[self.data_count]
+            self.data_store[self.power_addr] = served_value(self.solar_data, self.data_count)
             if self.data_count == len(self.solar_data) - 1:
                 self.data_count = 0
             else:
@@ -187,7 +206,7 @@ class House:
         # Server read function
         @self.app.route(slave_ids=[self.slave_id], function_codes=[3, 4], addresses=list(range(0, 1)))
         def read_data_store(slave_id, function_code, address):
-            self.data_store[self.power_addr] = self.house_data[self.data_count]
+            self.data_store[self.power_addr] = served_value(self.house_data, self.data_count)
             if self.data_count == len(self.house_data) - 1:
                 self.data_count = 0
             else:
@@ -208,32 +227,36 @@ class House:
             self.thread = None
 
 
+def load_data(config_settings):
+
+    # Data File Names
+    file_name = config_settings.simulation["data_file_name"]
+    solar_name = config_settings.simulation["solar_row_name"]
+    house_name = config_settings.simulation["house_row_name"]
+
+    # Cached CSV columns (kW), memory-mapped so only the rows served are read from disk
+    profile_data = ProfileData(config_settings, file_name, [solar_name, house_name])
+    return profile_data.column(solar_name), profile_data.column(house_name)
+
+
+def served_value(data, index):
+    # Profile value (kW) as served by the solar and house servers, whole W
+    return int(data[index] * 1000)
+
+
 class Servers:
     def __init__(self):
 
         # Reads settings configuration file
         self.settings = Settings()
 
-        # Setting up Data
-        self.solar_data = list()
-        self.house_data = list()
-
         # Servers Variables
         self.battery = None
         self.solar = None
         self.house = None
 
-        # Data File Names
-        file_name = self.settings.simulation["data_file_name"]
-        solar_name = self.settings.simulation["solar_row_name"]
-        house_name = self.settings.simulation["house_row_name"]
-
         # Reading CSV File
-        with open(file_name, mode='r') as csv_file:
-            csv_reader = csv.DictReader(csv_file)
-            for row in csv_reader:
-                self.solar_data.append(int(float(row[solar_name]) * 1000))
-                self.house_data.append(int(float(row[house_name]) * 1000))
+        self.solar_data, self.house_data = load_data(self.settings)
 
     def start(self):
         self.battery = Battery(self.settings)
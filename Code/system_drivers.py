@@ -1,41 +1,47 @@
 # Server Reading and Writing Capabilities enabled by Open Source 'pysunspec' managed by SunSpec Alliance
 # pub-sub capabilities provided by 'pyzmq', Python handler of ZeroMQ protocols
 
-import struct
+import heapq
 import threading
 import time
-from _thread import get_ident
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 import zmq
-from sunspec.core.client import ClientDevice
-
-
-class Event:
-    def __init__(self):
-        self.events = dict()
-
-    def wait(self):
-        identifier = get_ident()
-        if identifier not in self.events:
-            self.events[identifier] = [threading.Event(), time.time()]
-        return self.events[identifier][0].wait()
-
-    def set(self):
-        now = time.time()
-        remove = None
-        for identifier, event in self.events.items():
-            if not event[0].isSet():
-                event[0].set()
-                event[1] = now
-            else:
-                if now - event[1] > 3:
-                    remove = identifier
-        if remove:
-            del self.events[remove]
 
-    def clear(self):
-        self.events[get_ident()][0].clear()
+from Code.command_queue import CommandQueue
+from Code.message_channel import MessageChannel
+from Code.modbus_device import ModbusDevice
+from Code.ring_buffer import RingBuffer
+
+
+def check_publications(config_settings, devices):
+
+    # Each published entry has its own name, the server it is read from is given separately
+    names = [device["name"] for device in devices]
+    for name in set(names):
+        if names.count(name) > 1:
+            print('Driver device name ' + name + ' is used more than once\nSee Config File for Valid Settings')
+            raise KeyError(name)
+
+    # A register the server does not read would publish its initial value forever
+    for device in devices:
+        if device["register"] not in config_settings.server[device["server"]]["read_registers"]:
+            print('Warning: ' + device["name"] + ' publishes ' + device["register"] + ', which is not in the '
+                  + device["server"] + ' server read_registers, its initial value will always be published')
+
+
+def create_channels(config_settings, context, devices):
+
+    # One PUB socket per port, devices sharing a port are told apart by their topic
+    sockets = dict()
+    channels = dict()
+    for device in devices:
+        if device["port"] not in sockets:
+            sockets[device["port"]] = context.socket(zmq.PUB)
+            sockets[device["port"]].bind("tcp://*:%s" % device["port"])
+        channels[device["name"]] = MessageChannel(config_settings, sockets[device["port"]], device["topic"])
+    return channels
 
 
 class SunSpecDriver:
@@ -44,159 +50,155 @@ class SunSpecDriver:
         # Reads settings configuration file
         self.settings = config_settings
 
-        # Connecting SunSpec Clients
-        print(self.settings.server["battery"]["ipaddr"])
-        self.battery_client = ClientDevice(device_type=self.settings.server["battery"]["device_type"],
-                                           slave_id=self.settings.server["battery"]["slave_id"],
-                                           ipaddr=self.settings.server["battery"]["ipaddr"],
-                                           ipport=self.settings.server["battery"]["ipport"])
-        self.solar_client = ClientDevice(device_type=self.settings.server["solar"]["device_type"],
-                                         slave_id=self.settings.server["solar"]["slave_id"],
-                                         ipaddr=self.settings.server["solar"]["ipaddr"],
-                                         ipport=self.settings.server["solar"]["ipport"])
-        self.house_client = ClientDevice(device_type=self.settings.server["house"]["device_type"],
-                                         slave_id=self.settings.server["house"]["slave_id"],
-                                         ipaddr=self.settings.server["house"]["ipaddr"],
-                                         ipport=self.settings.server["house"]["ipport"])
-
-        # Event Classes
-        self.bat_event = Event()
-        self.solar_event = Event()
-        self.house_event = Event()
-
-        # Publisher Time Variables
-        self.bat_time = self.settings.ZeroMQ["battery_pub_time"]
-        self.solar_time = self.settings.ZeroMQ["solar_pub_time"]
-        self.house_time = self.settings.ZeroMQ["house_pub_time"]
+        # Devices read and published by the driver, each reads a register from its server when it is
+        # due (poll_interval) or after each new battery power (event_read)
+        self.devices = self.settings.driver["devices"]
+        check_publications(self.settings, self.devices)
+        self.power_server = self.settings.driver["power_server"]
+        self.power_register = self.settings.driver["power_register"]
+
+        # SunSpec Devices and Command Queues, one per server, run on a fixed pool of worker threads
+        print(self.settings.server[self.power_server]["ipaddr"])
+        self.executor = ThreadPoolExecutor(max_workers=self.settings.driver["workers"])
+        self.queues = dict()
+        for server in {device["server"] for device in self.devices} | {self.power_server}:
+            self.queues[server] = CommandQueue(self.settings, ModbusDevice(self.settings, server), self.executor)
+        self.statistics_interval = self.settings.driver["statistics_interval"]
+
+        # Scheduler State, reads completed by the workers are published by the scheduler thread
+        self.condition = threading.Condition()
+        self.completed_reads = list()
+        self.triggered = False
+        self.schedule = list()
+        self.pending = {device["name"]: None for device in self.devices}
+        self.values = {device["name"]: device.get("initial_value", 0) for device in self.devices}
+
+        # Scheduler Statistics
+        self.overruns = {device["name"]: 0 for device in self.devices}
+        self.read_latency = {device["name"]: RingBuffer(self.settings.driver["latency_samples"], ("latency",))
+                             for device in self.devices}
+        self.lateness = {device["name"]: RingBuffer(self.settings.driver["latency_samples"], ("lateness",))
+                         for device in self.devices}
 
         # Connection Variables
-        self.battery_connect = 0
-        self.solar_connect = 0
-        self.house_connect = 0
+        self.connected = False
         self.initial_time = None
 
-        # Parameters in case of simultaneous battery read and writes
-        self.bat_read = 0
-        self.bat_write = 0
-
         # ZeroMQ Settings
-        self.bat_port = str(self.settings.ZeroMQ["battery_SOC_port"])
-        self.solar_port = str(self.settings.ZeroMQ["solar_port"])
-        self.house_port = str(self.settings.ZeroMQ["house_port"])
         self.sub_port = str(self.settings.ZeroMQ["battery_power_port"])
-        self.batterySOC_topic = self.settings.ZeroMQ["battery_SOC_topic"]
-        self.solar_topic = self.settings.ZeroMQ["solar_topic"]
-        self.house_topic = self.settings.ZeroMQ["solar_topic"]
         self.batteryW_topic = str(self.settings.ZeroMQ["battery_power_topic"])
 
         # Defines Sockets and Threads
-        self.bat_socket = None
-        self.solar_socket = None
-        self.house_socket = None
+        self.channels = dict()
         self.sub_socket = None
+        self.sub_channel = None
 
-        self.bat_pub_thread = None
-        self.solar_thread = None
-        self.house_thread = None
+        self.scheduler_thread = None
         self.bat_sub_thread = None
+        self.statistics_thread = None
 
         # Starts Drivers
         self.start_drivers()
 
     def start_drivers(self):
         context = zmq.Context()
-        self.bat_socket = context.socket(zmq.PUB)
-        self.bat_socket.bind("tcp://*:%s" % self.bat_port)
-        self.solar_socket = context.socket(zmq.PUB)
-        self.solar_socket.bind("tcp://*:%s" % self.solar_port)
-        self.house_socket = context.socket(zmq.PUB)
-        self.house_socket.bind("tcp://*:%s" % self.house_port)
+        self.channels = create_channels(self.settings, context, self.devices)
         self.sub_socket = context.socket(zmq.SUB)
+        self.sub_channel = MessageChannel(self.settings, self.sub_socket, self.batteryW_topic)
 
-        # Starts Battery SOC Driver Thread
-        print('starting battery SOC driver')
-        self.bat_pub_thread = threading.Thread(target=self.battery_publisher)
-        self.bat_pub_thread.start()
-
-        # Starts Solar Driver Thread
-        print('starting solar driver')
-        self.solar_thread = threading.Thread(target=self.solar_publisher)
-        self.solar_thread.start()
-
-        # Starts House Driver Thread
-        print('starting house driver')
-        self.house_thread = threading.Thread(target=self.house_publisher)
-        self.house_thread.start()
+        # Starts Scheduler Thread, one thread reads and publishes every device
+        print('starting driver scheduler for ' + str(len(self.devices)) + ' devices')
+        self.scheduler_thread = threading.Thread(target=self.scheduler)
+        self.scheduler_thread.start()
 
         # Starts Battery Subscriber Thread
         print('starting battery subscriber')
         self.bat_sub_thread = threading.Thread(target=self.battery_subscriber)
         self.bat_sub_thread.start()
 
-    def battery_publisher(self):
-        battery_soc_decode = struct.pack(">h", int(self.settings.battery["initial_SOC"]))
-        while True:
-            # Makes sure initial connection is established
-            if self.battery_connect == 0:
-                self.bat_socket.send_string("%d %s" % (self.batterySOC_topic, 'bat_connect'))
-            else:
-                # SunSpec Reading and Decoding
-                self.bat_read = 1
-                if self.bat_write == 0:
-                    battery_soc_decode = self.battery_client.read(self.settings.server["battery"]["SOCaddr"], 1)
-                else:
-                    print('skip battery READ')
-                self.bat_read = 0
-
-                soc_value = np.int16(int.from_bytes(battery_soc_decode, byteorder='big'))
-
-                # ZeroMQ Publishing
-                self.bat_socket.send_string("%d %d" % (self.batterySOC_topic, soc_value))
-
-                # Publishing Method
-                if self.settings.ZeroMQ["use_event_pub"]:
-                    self.bat_event.wait()
-                    self.bat_event.clear()
-                else:
-                    time.sleep(self.bat_time - ((time.time() - self.initial_time) % self.bat_time))
-
-    def solar_publisher(self):
-        while True:
-            # Makes sure initial connection is established
-            if self.solar_connect == 0:
-                self.solar_socket.send_string("%d %s" % (self.solar_topic, 'solar_connect'))
-            else:
-                # SunSpec Reading and Decoding
-                solar_decode = self.solar_client.read(self.settings.server["solar"]["poweraddr"], 1)
-                solar_value = np.int16(int.from_bytes(solar_decode, byteorder='big'))
-
-                self.solar_socket.send_string("%d %d" % (self.solar_topic, solar_value))
+        # Starts Statistics Thread
+        if self.statistics_interval:
+            self.statistics_thread = threading.Thread(target=self.report_statistics)
+            self.statistics_thread.daemon = True
+            self.statistics_thread.start()
 
-                # Publishing Method
-                if self.settings.ZeroMQ["use_event_pub"]:
-                    self.solar_event.wait()
-                    self.solar_event.clear()
-                else:
-                    time.sleep(self.solar_time - ((time.time() - self.initial_time) % self.solar_time))
+    def scheduler(self):
 
-    def house_publisher(self):
-        while True:
-            # Makes sure initial connection is established
-            if self.house_connect == 0:
-                self.house_socket.send_string("%d %s" % (self.house_topic, 'house_connect'))
-            else:
-                # SunSpec Reading and Decoding
-                house_decode = self.house_client.read(self.settings.server["house"]["poweraddr"], 1)
-                house_value = np.int16(int.from_bytes(house_decode, byteorder='big'))
+        # Makes sure initial connection is established
+        while not self.connected:
+            for device in self.devices:
+                self.channels[device["name"]].send_token(device["token"])
+            time.sleep(0.01)
 
-                self.house_socket.send_string("%d %d" % (self.house_topic, house_value))
+        # Every device is read once at the start, polled devices are then read on their own interval
+        for index, device in enumerate(self.devices):
+            self.request_read(device, self.initial_time)
+            if not device["event_read"]:
+                heapq.heappush(self.schedule, (self.initial_time + device["poll_interval"], index))
 
-                # Publishing Method
-                if self.settings.ZeroMQ["use_event_pub"]:
-                    self.house_event.wait()
-                    self.house_event.clear()
-                else:
-                    time.sleep(self.house_time - ((time.time() - self.initial_time) % self.house_time))
+        while True:
+            # Sleeps until a read completes, a new battery power arrives or the next poll is due
+            with self.condition:
+                if not self.completed_reads and not self.triggered:
+                    self.condition.wait(max(0.0, self.schedule[0][0] - time.time()) if self.schedule else None)
+                completed_reads = self.completed_reads
+                self.completed_reads = list()
+                triggered = self.triggered
+                self.triggered = False
+
+            # ZeroMQ Publishing
+            for device, values, request_time, source_time in completed_reads:
+                self.publish(device, values, request_time, source_time)
+
+            # Event Reads
+            if triggered:
+                for device in self.devices:
+                    if device["event_read"]:
+                        self.request_read(device, time.time())
+
+            # Polled Reads, a missed poll time is skipped rather than read late more than once
+            now = time.time()
+            while self.schedule and self.schedule[0][0] <= now:
+                due_time, index = heapq.heappop(self.schedule)
+                device = self.devices[index]
+                self.request_read(device, due_time)
+                next_time = due_time + device["poll_interval"]
+                if next_time <= now:
+                    next_time += (now - next_time) // device["poll_interval"] * device["poll_interval"] \
+                                 + device["poll_interval"]
+                heapq.heappush(self.schedule, (next_time, index))
+
+    def request_read(self, device, due_time):
+        name = device["name"]
+
+        # A device still being read is not read again
+        if self.pending[name] is not None:
+            self.overruns[name] += 1
+            return
+        request_time = time.time()
+        self.lateness[name].append(lateness=max(0.0, request_time - due_time))
+        self.pending[name] = request_time
+        queue = self.queues[device["server"]]
+        modbus_device = queue.modbus_device
+        if not queue.read(lambda values: self.read_complete(device, values, request_time,
+                                                            modbus_device.last_read_time)):
+            self.pending[name] = None
+
+    def read_complete(self, device, values, request_time, source_time):
+
+        # Called from a worker thread, the scheduler thread owns the sockets
+        with self.condition:
+            self.completed_reads.append((device, values, request_time, source_time))
+            self.condition.notify()
+
+    def publish(self, device, values, request_time, source_time):
+        name = device["name"]
+        self.pending[name] = None
+        self.read_latency[name].append(latency=time.time() - request_time)
+
+        # Sent with the time the values were read, a failed read repeats the last value with its original time
+        self.values[name] = values.get(device["register"], self.values[name])
+        self.channels[name].send(self.values[name], source_time)
 
     def battery_subscriber(self):
         # Connects Subscriber to socket and topic
@@ -205,27 +207,40 @@ class SunSpecDriver:
 
         while True:
             # ZeroMQ Subscribing
-            power_string = self.sub_socket.recv()
-            power_topic, bat_power = power_string.split()
+            bat_power = self.sub_channel.receive()
 
             # Makes sure initial connection is established
             if bat_power == b'connected':
                 self.initial_time = time.time()
-                self.battery_connect = 1
-                self.solar_connect = 1
-                self.house_connect = 1
+                self.connected = True
             else:
-                # Writes new Power Value to Battery Server
-                bat_power = int(bat_power)
-                self.bat_write = 1
-                if self.bat_read == 0:
-                    self.battery_client.write(self.settings.server["battery"]["poweraddr"], struct.pack(">h", bat_power))
-                else:
-                    print('skip battery WRITE')
-
-                # Sets to read new values from servers
-                self.bat_event.set()
-                self.bat_write = 0
-                self.solar_event.set()
-                self.house_event.set()
-
+                # Queues new Power Value for the Battery Server, replacing one not yet written
+                self.queues[self.power_server].set_point(self.power_register, int(bat_power))
+
+                # Sets to read new values from servers, a battery read is queued behind the write
+                with self.condition:
+                    self.triggered = True
+                    self.condition.notify()
+
+    def statistics(self):
+        statistics = dict()
+        for device in self.devices:
+            name = device["name"]
+            latency = self.read_latency[name].view("latency")
+            lateness = self.lateness[name].view("lateness")
+            statistics[name] = {"overruns": self.overruns[name],
+                                "mean_read_latency": float(np.mean(latency)) if len(latency) else 0,
+                                "max_read_latency": float(np.max(latency)) if len(latency) else 0,
+                                "mean_lateness": float(np.mean(lateness)) if len(lateness) else 0,
+                                "queue": self.queues[device["server"]].statistics()}
+        return statistics
+
+    def report_statistics(self):
+        while True:
+            time.sleep(self.statistics_interval)
+            for device, statistics in self.statistics().items():
+                print(device + ' queue depth = ' + str(statistics["queue"]["depth"]) + ', coalesced = '
+                      + str(statistics["queue"]["coalesced"]) + ', dropped = ' + str(statistics["queue"]["dropped"])
+                      + ', overruns = ' + str(statistics["overruns"]) + ', mean read latency = '
+                      + str(round(statistics["mean_read_latency"] * 1000, 2)) + ' ms, mean write latency = '
+                      + str(round(statistics["queue"]["mean_write_latency"] * 1000, 2)) + ' ms')
@@ -0,0 +1,116 @@
+import datetime
+import queue
+import threading
+import time
+
+
+class TelemetryWriter:
+    def __init__(self, config_settings):
+
+        # Obtains settings from config file
+        self.settings = config_settings
+        self.file_name = self.settings.telemetry["file_name"]
+        self.batch_size = self.settings.telemetry["batch_size"]
+        self.flush_interval = self.settings.telemetry["flush_interval"]
+        self.rotate_daily = self.settings.telemetry["rotate_daily"]
+
+        # Records are queued by the subscriber threads and written by the writer thread,
+        # records are dropped rather than blocking when the queue is full
+        self.queue = queue.Queue(maxsize=self.settings.telemetry["queue_size"])
+        self.stop_marker = object()
+
+        # Pipeline Counters
+        self.records_written = 0
+        self.records_dropped = 0
+        self.flush_count = 0
+        self.last_flush_latency = 0
+        self.max_flush_latency = 0
+        self.total_flush_latency = 0
+
+        # Opens the first file, erasing previous contents
+        self.file = None
+        self.file_day = None
+        self.open_file()
+
+        # Starts Writer Thread
+        self.writer_thread = threading.Thread(target=self.writer)
+        self.writer_thread.daemon = True
+        self.writer_thread.start()
+
+    def current_file_name(self):
+        if self.rotate_daily:
+            return self.file_name + "_" + self.file_day.isoformat() + ".txt"
+        return self.file_name + ".txt"
+
+    def open_file(self):
+        if self.file is not None:
+            self.file.close()
+        self.file_day = datetime.date.today()
+        self.file = open(self.current_file_name(), "w+")
+
+    def write(self, device, curr_time, value):
+
+        # Never blocks the calling thread
+        try:
+            self.queue.put_nowait((device, curr_time, value))
+        except queue.Full:
+            self.records_dropped += 1
+
+    def flush(self, batch):
+        flush_start = time.time()
+
+        # Moves to a new file at the start of each day
+        if self.rotate_daily and datetime.date.today() != self.file_day:
+            self.open_file()
+
+        self.file.write("".join("\n" + device + " " + str(curr_time) + " " + str(value)
+                                for device, curr_time, value in batch))
+        self.file.flush()
+
+        # Updates Counters
+        self.last_flush_latency = time.time() - flush_start
+        self.max_flush_latency = max(self.max_flush_latency, self.last_flush_latency)
+        self.total_flush_latency += self.last_flush_latency
+        self.records_written += len(batch)
+        self.flush_count += 1
+
+    def writer(self):
+        batch = list()
+        last_flush = time.time()
+        while True:
+
+            # Waits for a record until the next timed flush is due
+            try:
+                record = self.queue.get(timeout=max(0, self.flush_interval - (time.time() - last_flush)))
+            except queue.Empty:
+                record = None
+
+            if record is self.stop_marker:
+                if batch:
+                    self.flush(batch)
+                self.file.close()
+                break
+            if record is not None:
+                batch.append(record)
+
+            # Flushes on batch size or time
+            if len(batch) >= self.batch_size or (batch and time.time() - last_flush >= self.flush_interval):
+                self.flush(batch)
+                batch = list()
+            if not batch:
+                last_flush = time.time()
+
+    def counters(self):
+        return {"written": self.records_written,
+                "dropped": self.records_dropped,
+                "queued": self.queue.qsize(),
+                "flushes": self.flush_count,
+                "last_flush_latency": self.last_flush_latency,
+                "max_flush_latency": self.max_flush_latency,
+                "mean_flush_latency": self.total_flush_latency / self.flush_count if self.flush_count else 0}
+
+    def stop(self):
+
+        # Writes any remaining records and closes the file
+        self.queue.put(self.stop_marker)
+        self.writer_thread.join()
@@ -0,0 +1,132 @@
+# Checks the asyncio driver request deadlines against the simulation_servers stand-ins, run from Code/ with
+# python -m pytest test_async_driver.py
+
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from Code.async_driver import AsyncSunSpecDriver
+from Code.simulation_servers import Battery, House, Settings, Solar, load_data
+
+# Servers are moved clear of the configured ports so a running system is not disturbed
+PORT_OFFSET = 20000
+REQUEST_DEADLINE = 0.2
+SLOW_RESPONSE = 1.0
+
+
+class SlowProfile:
+    def __init__(self, data):
+
+        # Profile served by a simulation server, each row read waits delay seconds first
+        self.data = data
+        self.delay = 0
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, index):
+        time.sleep(self.delay)
+        return self.data[index]
+
+
+class RecordingChannel:
+    def __init__(self):
+
+        # Every value sent, with its source time and when it was sent
+        self.sent = list()
+
+    def send(self, value, source_time=None):
+        self.sent.append((value, source_time, time.time()))
+
+    def send_token(self, token):
+        pass
+
+
+@pytest.fixture
+def settings(monkeypatch):
+
+    # Settings are read from the config file next to this test
+    monkeypatch.chdir(os.path.dirname(os.path.abspath(__file__)))
+    config_settings = Settings()
+    for server in config_settings.server.values():
+        server["ipport"] += PORT_OFFSET
+    config_settings.driver["request_deadline"] = REQUEST_DEADLINE
+    config_settings.driver["statistics_interval"] = 0
+    config_settings.data_cache["enabled"] = False
+    return config_settings
+
+
+@pytest.fixture
+def servers(settings):
+    solar_data, house_data = load_data(settings)
+    slow_solar = SlowProfile(solar_data)
+    battery = Battery(settings)
+    solar = Solar(slow_solar, settings)
+    house = House(house_data, settings)
+    yield slow_solar
+
+    # Each server thread clears its own reference once stopped
+    slow_solar.delay = 0
+    threads = [server.thread for server in (battery, solar, house)]
+    for server in (battery, solar, house):
+        server.app.shutdown()
+    for thread in threads:
+        thread.join()
+
+
+@pytest.fixture
+def driver(settings, servers, monkeypatch):
+
+    # Publishes to recording channels rather than ZeroMQ sockets, publish is driven by the test
+    monkeypatch.setattr(AsyncSunSpecDriver, "start_drivers", lambda self: None)
+    async_driver = AsyncSunSpecDriver(settings)
+    async_driver.channels = {device["name"]: RecordingChannel() for device in async_driver.publications}
+    return async_driver
+
+
+async def publish_all(driver):
+
+    # One publish of every device, polled concurrently as the driver's publishers are
+    await asyncio.gather(*[driver.publish(device, driver.channels[device["name"]])
+                           for device in driver.publications])
+
+
+def test_late_response_is_stale_and_does_not_block(driver, servers):
+    channels = driver.channels
+    device_servers = {device["name"]: driver.devices[device["server"]] for device in driver.publications}
+    solar_device = device_servers["solar"]
+
+    async def publish_rounds():
+
+        # Every server answers in time, then the solar server answers after the deadline
+        await publish_all(driver)
+        servers.delay = SLOW_RESPONSE
+        round_start = time.time()
+        await publish_all(driver)
+        round_time = time.time() - round_start
+        servers.delay = 0
+        for modbus_device in driver.devices.values():
+            modbus_device.disconnect()
+        return round_start, round_time
+
+    round_start, round_time = asyncio.run(publish_rounds())
+
+    # The last solar value is republished with the time it was read, flagged as stale
+    first_value, first_time, _ = channels["solar"].sent[0]
+    assert channels["solar"].sent[-1][:2] == (first_value, first_time)
+    assert first_time is not None
+    assert solar_device.stale is True
+    assert solar_device.stale_reads == 1
+    assert solar_device.timeouts == 1
+
+    # The other devices publish fresh values without waiting for the slow server
+    for name in ("soc", "house"):
+        value, source_time, send_time = channels[name].sent[-1]
+        assert source_time > first_time
+        assert send_time - round_start < REQUEST_DEADLINE
+        assert device_servers[name].stale is False
+    assert round_time < SLOW_RESPONSE
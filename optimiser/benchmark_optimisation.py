@@ -0,0 +1,175 @@
+import time
+
+import numpy as np
+from pyomo.core import Var
+
+# Since using the data-driven data for the testing, use their battery class
+import sys
+sys.path.append("../")
+from optimiser.models import EnergyStorage, EnergySystem, Load, PV, Tariff
+from optimiser.energy_optimiser import EnergyOptimiser, OptimiserObjectiveSet
+from optimiser.matrix_optimiser import MatrixEnergyOptimiser
+from optimiser.fleet_optimiser import FleetOptimiser, optimise_energy_system
+
+
+############################ Benchmark Settings ########################################
+
+interval_duration = 5  # minutes
+number_of_intervals = 288
+number_of_repeats = 20
+builder_horizons = [96, 288, 1440, 2880]
+fleet_sizes = [10, 100]
+fleet_engine = "clarabel"
+
+objective_sets = {"Financial": OptimiserObjectiveSet.FinancialOptimisation,
+                  "Energy": OptimiserObjectiveSet.EnergyOptimisation,
+                  "Peak": OptimiserObjectiveSet.PeakOptimisation,
+                  "FEP": OptimiserObjectiveSet.FEP,
+                  "QuantisedPeak": OptimiserObjectiveSet.QuantisedPeakOptimisation}
+
+
+def create_energy_system(intervals, seed=0, capacity=15.0):
+    random_state = np.random.RandomState(seed)
+
+    battery = EnergyStorage(max_capacity=capacity,
+                            depth_of_discharge_limit=0,
+                            charging_power_limit=5.0,
+                            discharging_power_limit=-5.0,
+                            charging_efficiency=1,
+                            discharging_efficiency=1,
+                            throughput_cost=0.018,
+                            initial_state_of_charge=random_state.uniform(0, capacity))
+
+    # Load and pv in kWh per interval, pv generation is negative to match convention
+    load = Load()
+    load.add_load_profile(random_state.uniform(0.0, 0.3, intervals))
+    pv = PV()
+    pv.add_pv_profile(-random_state.uniform(0.0, 0.4, intervals))
+
+    tariff = Tariff()
+    tariff.add_tariff_profile_import(dict(enumerate(random_state.choice([0.15, 0.35, 0.45], intervals))))
+    tariff.add_tariff_profile_export(dict(enumerate([0.09] * intervals)))
+
+    energy_system = EnergySystem()
+    energy_system.add_energy_storage(battery)
+    energy_system.add_load(load)
+    energy_system.add_pv(pv)
+    energy_system.add_tariff(tariff)
+    return energy_system
+
+
+def benchmark_persistent_model(objective, intervals=number_of_intervals, repeats=number_of_repeats):
+    energy_systems = [create_energy_system(intervals, seed) for seed in range(repeats)]
+
+    # Rebuilding the model for every optimiser step
+    rebuild_times = list()
+    for energy_system in energy_systems:
+        optimiser = EnergyOptimiser(interval_duration, intervals, energy_system, objective, solve=False)
+        rebuild_times.append(optimiser.build_time)
+
+    # Building once and re-parameterising the model for every optimiser step
+    update_times = list()
+    optimiser = EnergyOptimiser(interval_duration, intervals, energy_systems[0], objective, solve=False)
+    for energy_system in energy_systems:
+        optimiser.update_energy_system(energy_system)
+        update_times.append(optimiser.update_time)
+
+    return np.mean(rebuild_times), np.mean(update_times)
+
+
+def benchmark_model_builders(objective, intervals):
+    energy_system = create_energy_system(intervals)
+
+    # Per-interval Pyomo rules
+    pyomo_optimiser = EnergyOptimiser(interval_duration, intervals, energy_system, objective, solve=False)
+
+    # Matrix assembly, followed by the hand over of the matrices to Pyomo for solving
+    matrix_optimiser = MatrixEnergyOptimiser(interval_duration, intervals, energy_system, objective, solve=False)
+    transfer_start = time.time()
+    matrix_optimiser.build_pyomo_model()
+    matrix_optimiser.update_pyomo_model()
+    transfer_time = time.time() - transfer_start
+
+    return pyomo_optimiser.build_time, matrix_optimiser.build_time, transfer_time
+
+
+def extract_by_declaration_order(model, intervals):
+    # The previous extraction, walking every variable in declaration order
+    output_vars = np.zeros((12, intervals))
+    j = 0
+    for v in model.component_objects(Var, active=True):
+        var_object = getattr(model, str(v))
+        for index in var_object:
+            output_vars[j, index] = var_object[index].value
+        j += 1
+        if j >= 12:
+            break
+    return output_vars[3] + output_vars[4] + output_vars[5] + output_vars[6]
+
+
+def benchmark_result_extraction(objective, intervals):
+    optimiser = EnergyOptimiser(interval_duration, intervals, create_energy_system(intervals), objective,
+                                solve=False)
+
+    # Unsolved peak variables have no value, the extraction is timed all the same
+    optimiser.model.peak_connection_point_import_power.value = 0
+    optimiser.model.peak_connection_point_export_power.value = 0
+
+    loop_start = time.time()
+    extract_by_declaration_order(optimiser.model, intervals)
+    loop_time = time.time() - loop_start
+
+    named_start = time.time()
+    optimiser.extract_results()
+    named_time = time.time() - named_start
+
+    return loop_time, named_time
+
+
+def benchmark_fleet(objective, houses, intervals=number_of_intervals):
+    energy_systems = [create_energy_system(intervals, seed) for seed in range(houses)]
+
+    # One house after another in this process
+    sequential_start = time.time()
+    for energy_system in energy_systems:
+        optimise_energy_system((interval_duration, intervals, energy_system, objective, fleet_engine))
+    sequential_throughput = houses / (time.time() - sequential_start)
+
+    fleet_optimiser = FleetOptimiser(interval_duration, intervals, energy_systems, objective,
+                                     optimiser_engine=fleet_engine)
+    fleet_optimiser.optimise_parallel()
+    parallel_throughput = fleet_optimiser.throughput
+    fleet_optimiser.optimise_block_diagonal()
+    stacked_throughput = fleet_optimiser.throughput
+
+    return sequential_throughput, parallel_throughput, stacked_throughput
+
+
+if __name__ == '__main__':
+
+    print('Model preparation time per optimiser step (' + str(number_of_intervals) + ' intervals)')
+    for name, objective in objective_sets.items():
+        rebuild_time, update_time = benchmark_persistent_model(objective)
+        print(name + ': rebuild = ' + str(round(rebuild_time * 1000, 2)) + ' ms, '
+              + 'persistent update = ' + str(round(update_time * 1000, 2)) + ' ms, '
+              + 'saved = ' + str(round((rebuild_time - update_time) * 1000, 2)) + ' ms per solve')
+
+    print('\nModel build time by builder (FEP objective)')
+    for intervals in builder_horizons:
+        pyomo_time, matrix_time, transfer_time = benchmark_model_builders(OptimiserObjectiveSet.FEP, intervals)
+        print(str(intervals) + ' intervals: Pyomo = ' + str(round(pyomo_time * 1000, 2)) + ' ms, '
+              + 'Matrix = ' + str(round(matrix_time * 1000, 2)) + ' ms '
+              + '(+ ' + str(round(transfer_time * 1000, 2)) + ' ms to hand to Pyomo)')
+
+    print('\nResult extraction time (FEP objective)')
+    for intervals in builder_horizons:
+        loop_time, named_time = benchmark_result_extraction(OptimiserObjectiveSet.FEP, intervals)
+        print(str(intervals) + ' intervals: declaration order loop = ' + str(round(loop_time * 1000, 2)) + ' ms, '
+              + 'named results = ' + str(round(named_time * 1000, 2)) + ' ms')
+
+    print('\nFleet throughput (FEP objective, ' + str(number_of_intervals) + ' intervals, ' + fleet_engine + ')')
+    for houses in fleet_sizes:
+        sequential, parallel, stacked = benchmark_fleet(OptimiserObjectiveSet.FEP, houses)
+        print(str(houses) + ' houses: sequential = ' + str(round(sequential, 1)) + ' houses/s, '
+              + 'process pool = ' + str(round(parallel, 1)) + ' houses/s, '
+              + 'block diagonal = ' + str(round(stacked, 1)) + ' houses/s')
@@ -0,0 +1,109 @@
+import datetime
+import json
+import platform
+import time
+
+import numpy as np
+import pyomo
+from pyomo.opt import SolverFactory
+
+# Since using the data-driven data for the testing, use their battery class
+import sys
+sys.path.append("../")
+from optimiser.matrix_optimiser import MatrixEnergyOptimiser
+from optimiser.solvers import in_process_solvers, solver_status
+from optimiser.benchmark_optimisation import create_energy_system, interval_duration, objective_sets
+
+
+############################ Suite Settings ########################################
+
+horizons = [96, 288, 1440, 2880]
+battery_capacities = [2.0, 4.0, 6.0, 8.0, 10.0, 12.0, 15.0]  # kWh, the sizes in Test Results
+number_of_repeats = 3
+
+# The builder and solver being measured, e.g. (EnergyOptimiser, "cplex") for the Pyomo path
+model_builder = MatrixEnergyOptimiser
+optimiser_engine = "clarabel"
+
+# Written to the file named on the command line when given
+output_file_name = "benchmark_results.json"
+
+
+def engine_available(engine):
+    # The in-process solvers are imported when used, external solvers must be installed on the host machine
+    if engine in in_process_solvers:
+        return True
+    return bool(SolverFactory(engine).available(exception_flag=False))
+
+
+def time_optimiser(objective, intervals, capacity, seed):
+    energy_system = create_energy_system(intervals, seed, capacity)
+
+    optimiser = model_builder(interval_duration, intervals, energy_system, objective, solve=False,
+                              optimiser_engine=optimiser_engine)
+    optimiser.optimise()
+
+    extraction_start = time.time()
+    results = optimiser.extract_results()
+    extraction_time = time.time() - extraction_start
+
+    return {"build_time": optimiser.build_time,
+            "solve_time": optimiser.solve_time,
+            "extraction_time": extraction_time,
+            "status": solver_status(optimiser.results),
+            "storage_throughput": float(np.sum(np.abs(results.storage_energy_delta)))}
+
+
+def run_suite():
+    runs = list()
+    for objective_name, objective in objective_sets.items():
+        for intervals in horizons:
+            for capacity in battery_capacities:
+                run = {"objective": objective_name, "intervals": intervals, "capacity": capacity}
+                try:
+                    repeats = [time_optimiser(objective, intervals, capacity, seed)
+                               for seed in range(number_of_repeats)]
+                except Exception as error:
+                    # A failed solve is recorded so that the rest of the suite still runs
+                    run["error"] = repr(error)
+                    print(objective_name + ', ' + str(intervals) + ' intervals, ' + str(capacity) + ' kWh: '
+                          + run["error"])
+                    runs.append(run)
+                    continue
+
+                # Medians over the repeats, each repeat uses a different random profile
+                for phase in ("build_time", "solve_time", "extraction_time"):
+                    run[phase] = float(np.median([repeat[phase] for repeat in repeats]))
+                run["status"] = [repeat["status"] for repeat in repeats]
+                run["storage_throughput"] = [repeat["storage_throughput"] for repeat in repeats]
+                runs.append(run)
+
+                print(objective_name + ', ' + str(intervals) + ' intervals, ' + str(capacity) + ' kWh: '
+                      + 'build = ' + str(round(run["build_time"] * 1000, 1)) + ' ms, '
+                      + 'solve = ' + str(round(run["solve_time"] * 1000, 1)) + ' ms, '
+                      + 'extract = ' + str(round(run["extraction_time"] * 1000, 2)) + ' ms')
+
+    return {"created": datetime.datetime.now().isoformat(),
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "pyomo": pyomo.version.version,
+            "model_builder": model_builder.__name__,
+            "optimiser_engine": optimiser_engine,
+            "interval_duration": interval_duration,
+            "repeats": number_of_repeats,
+            "runs": runs}
+
+
+if __name__ == '__main__':
+
+    if len(sys.argv) > 1:
+        output_file_name = sys.argv[1]
+
+    if not engine_available(optimiser_engine):
+        print('The ' + optimiser_engine + ' solver is not available on this machine, no benchmarks were run')
+        sys.exit(1)
+
+    suite_results = run_suite()
+    with open(output_file_name, mode='w') as json_file:
+        json.dump(suite_results, json_file, indent=2)
+    print('Results written to ' + output_file_name)
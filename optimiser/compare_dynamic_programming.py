@@ -0,0 +1,127 @@
+import csv
+
+import numpy as np
+
+# Since using the data-driven data for the testing, use their battery class
+import sys
+sys.path.append("../")
+from optimiser.models import EnergyStorage, EnergySystem, Load, PV, Tariff
+from optimiser.energy_optimiser import OptimiserObjectiveSet
+from optimiser.matrix_optimiser import MatrixEnergyOptimiser
+from optimiser.dp_optimiser import DynamicProgrammingOptimiser
+
+
+############################ Comparison Settings ########################################
+
+# The data sets behind the plots in Test Results, a day is compared at a time
+data_sets = {"Random Set": "../Code/random_data_set.csv",
+             "Summer Set": "../Code/summer_data_set.csv",
+             "Winter Set": "../Code/winter_data_set.csv"}
+solar_row_name = "asolarp"
+house_row_name = "aloadp"
+interval_duration = 5  # minutes
+number_of_intervals = 288
+number_of_days = 3
+
+battery_capacities = [8.0, 15.0]  # kWh
+soc_resolutions = [0.1, 0.05, 0.01]  # kWh
+import_rate = 0.27  # $/kWh
+feed_in = 0.09  # $/kWh
+
+objective_sets = {"Financial": OptimiserObjectiveSet.FinancialOptimisation,
+                  "Energy": OptimiserObjectiveSet.EnergyOptimisation}
+
+# The solver path the dynamic program is compared against, (energy_optimiser.EnergyOptimiser, "cplex") needs a
+# CPLEX licence for the full horizon as CPLEX Community Edition is limited to smaller models
+reference_builder = MatrixEnergyOptimiser
+reference_engine = "clarabel"
+
+
+def read_data_set(file_name):
+    solar_data = list()
+    house_data = list()
+    with open(file_name, mode='r') as csv_file:
+        csv_reader = csv.DictReader(csv_file)
+        for row in csv_reader:
+            solar_data.append(float(row[solar_row_name]))
+            house_data.append(float(row[house_row_name]))
+
+    # Power readings (kW) to energy per interval (kWh)
+    return np.array(house_data) * interval_duration / 60, np.array(solar_data) * interval_duration / 60
+
+
+def create_energy_system(load_profile, pv_profile, capacity):
+    battery = EnergyStorage(max_capacity=capacity,
+                            depth_of_discharge_limit=0,
+                            charging_power_limit=5.0,
+                            discharging_power_limit=-5.0,
+                            charging_efficiency=1,
+                            discharging_efficiency=1,
+                            throughput_cost=0.018,
+                            initial_state_of_charge=0)
+
+    load = Load()
+    load.add_load_profile(load_profile)
+    pv = PV()
+    pv.add_pv_profile(pv_profile)
+
+    tariff = Tariff()
+    tariff.add_tariff_profile_import(dict(enumerate([import_rate] * len(load_profile))))
+    tariff.add_tariff_profile_export(dict(enumerate([feed_in] * len(load_profile))))
+
+    energy_system = EnergySystem()
+    energy_system.add_energy_storage(battery)
+    energy_system.add_load(load)
+    energy_system.add_pv(pv)
+    energy_system.add_tariff(tariff)
+    return energy_system
+
+
+def schedule_metrics(results):
+    # The bill ($) and the energy crossing the meter (kWh) for a schedule
+    bill = np.sum(import_rate * results.net_import + feed_in * results.net_export)
+    metered_energy = np.sum(results.net_import - results.net_export)
+    return bill, metered_energy
+
+
+def compare_day(load_profile, pv_profile, capacity, objective):
+    energy_system = create_energy_system(load_profile, pv_profile, capacity)
+
+    reference = reference_builder(interval_duration, number_of_intervals, energy_system, objective,
+                                  optimiser_engine=reference_engine)
+    reference_bill, reference_energy = schedule_metrics(reference.extract_results())
+
+    comparison = list()
+    for soc_resolution in soc_resolutions:
+        dynamic_program = DynamicProgrammingOptimiser(interval_duration, number_of_intervals, energy_system,
+                                                      objective, soc_resolution=soc_resolution)
+        bill, metered_energy = schedule_metrics(dynamic_program.extract_results())
+        comparison.append((soc_resolution,
+                           reference.build_time + reference.solve_time,
+                           dynamic_program.build_time + dynamic_program.solve_time,
+                           bill - reference_bill,
+                           metered_energy - reference_energy))
+    return comparison
+
+
+if __name__ == '__main__':
+
+    print('Dynamic programming against ' + reference_builder.__name__ + ' (' + reference_engine + '), '
+          + str(number_of_days) + ' days per data set, mean per day')
+    for set_name, file_name in data_sets.items():
+        load_data, pv_data = read_data_set(file_name)
+        for capacity in battery_capacities:
+            for objective_name, objective in objective_sets.items():
+                days = [compare_day(load_data[day * number_of_intervals:(day + 1) * number_of_intervals],
+                                    pv_data[day * number_of_intervals:(day + 1) * number_of_intervals],
+                                    capacity, objective)
+                        for day in range(number_of_days)]
+
+                for row in np.mean(np.array(days), axis=0):
+                    soc_resolution, reference_time, dp_time, bill_gap, energy_gap = row
+                    print(set_name + ', ' + str(capacity) + ' kWh, ' + objective_name
+                          + ', grid ' + str(round(soc_resolution, 3)) + ' kWh: '
+                          + 'solver = ' + str(round(reference_time * 1000, 1)) + ' ms, '
+                          + 'dp = ' + str(round(dp_time * 1000, 1)) + ' ms, '
+                          + 'bill gap = $' + str(round(bill_gap, 4)) + ', '
+                          + 'metered energy gap = ' + str(round(energy_gap, 3)) + ' kWh')
@@ -0,0 +1,227 @@
+"""
+A solver-free engine for a single battery under the Financial and Energy objective sets,
+the state of charge is discretised onto a grid and the schedule found by dynamic programming in numpy
+"""
+
+import time
+
+import numpy as np
+
+from optimiser.energy_optimiser import OptimiserObjective, OptimiserResults, minutes_per_hour
+from optimiser.matrix_optimiser import profile_array
+
+
+####################################################################
+
+
+class DynamicProgrammingOptimiser(object):
+
+    # The objectives with a cost that only depends on each interval's own storage action,
+    # the peak objectives couple every interval and need a solver
+    supported_objectives = [OptimiserObjective.ConnectionPointCost,
+                            OptimiserObjective.ConnectionPointEnergy,
+                            OptimiserObjective.ThroughputCost,
+                            OptimiserObjective.Throughput,
+                            OptimiserObjective.GreedySolarCharging,
+                            OptimiserObjective.GreedyLoadDischarging,
+                            OptimiserObjective.EqualStorageActions]
+
+    def __init__(self, interval_duration, number_of_intervals, energy_system, objective, solve=True,
+                 optimiser_engine="dp", soc_resolution=0.05):
+        self.interval_duration = interval_duration  # The duration (in minutes) of each of the intervals being optimised over
+        self.number_of_intervals = int(number_of_intervals)
+
+        # The duration may also be given per interval, e.g. fine intervals followed by coarser blocks
+        self.interval_hours = np.broadcast_to(np.asarray(interval_duration, dtype=float) / minutes_per_hour,
+                                              (self.number_of_intervals,))
+        self.energy_system = energy_system
+
+        # No solver is used, the engine argument is only accepted to match the other optimisers
+        self.optimiser_engine = "dp"
+
+        # The spacing (kWh) of the state of charge grid, finer grids cost more but lose less to rounding
+        self.soc_resolution = soc_resolution
+
+        # This value has been arbitrarily chosen, it matches the value used by EnergyOptimiser
+        self.smallM = 0.0001
+
+        for objective_type in objective:
+            if objective_type not in self.supported_objectives:
+                print('The Dynamic Programming Optimiser Only Supports the Financial and Energy Objectives\n'
+                      'See Config File for Valid Settings')
+                raise KeyError
+        self.objectives = objective
+
+        # There is no solver model, the schedule is held as arrays
+        self.model = None
+        self.results = None
+        self.values = None
+        self.objective_value = None
+
+        # Time taken to build the cost tables, to last update them and to last solve (seconds)
+        self.build_time = None
+        self.update_time = None
+        self.solve_time = None
+
+        build_start = time.time()
+        self.build_model()
+        self.build_objective()
+        self.build_time = time.time() - build_start
+
+        if solve:
+            self.optimise()
+
+    def build_model(self):
+        storage = self.energy_system.energy_storage
+
+        # The grid passes through the initial state of charge so that it needs no interpolation
+        initial = min(max(storage.initial_state_of_charge, 0), storage.capacity)
+        below = int(np.floor(initial / self.soc_resolution + 1e-9))
+        above = int(np.floor((storage.capacity - initial) / self.soc_resolution + 1e-9))
+        self.state_of_charge = initial + self.soc_resolution * np.arange(-below, above + 1)
+        self.initial_index = below
+
+        # Change in state of charge allowed by the power limits in each interval, in whole grid steps
+        self.charge_limit = storage.charging_power_limit * self.interval_hours
+        self.discharge_limit = storage.discharging_power_limit * self.interval_hours
+        max_increase = self.charge_limit * storage.charging_efficiency
+        max_decrease = self.discharge_limit / storage.discharging_efficiency
+        self.step_offsets = np.arange(int(np.floor(np.min(max_decrease) / self.soc_resolution + 1e-9)),
+                                      int(np.floor(np.max(max_increase) / self.soc_resolution + 1e-9)) + 1)
+        self.step_deltas = self.step_offsets * self.soc_resolution
+        self.step_feasible = (self.step_deltas >= max_decrease[:, np.newaxis] - 1e-9) & \
+                             (self.step_deltas <= max_increase[:, np.newaxis] + 1e-9)
+
+    def connection_point_profiles(self):
+        # Split the net load into import and export
+        net_load = profile_array(self.energy_system.load.load) + profile_array(self.energy_system.pv.pv)
+        return np.maximum(net_load, 0), np.minimum(net_load, 0)
+
+    def build_objective(self):
+        n = self.number_of_intervals
+        storage = self.energy_system.energy_storage
+
+        # The objective is linear in the net import and export, plus a cost per unit of throughput
+        self.import_weight = np.zeros(n)
+        self.export_weight = np.zeros(n)
+        self.throughput_weight = 0
+        self.action_weight = 0
+
+        interval_start = np.cumsum(self.interval_hours) - self.interval_hours
+        greedy_weight = 1 / n * (1 - interval_start / np.sum(self.interval_hours))
+
+        if OptimiserObjective.ConnectionPointCost in self.objectives:
+            self.import_weight += profile_array(self.energy_system.tariff.import_tariff)
+            self.export_weight += profile_array(self.energy_system.tariff.export_tariff)
+
+        if OptimiserObjective.ConnectionPointEnergy in self.objectives:
+            self.import_weight += 1
+            self.export_weight -= 1
+
+        if OptimiserObjective.ThroughputCost in self.objectives:
+            self.throughput_weight += storage.throughput_cost / 2.0
+
+        if OptimiserObjective.Throughput in self.objectives:
+            self.throughput_weight += self.smallM
+
+        if OptimiserObjective.GreedySolarCharging in self.objectives:
+            self.export_weight -= greedy_weight
+
+        if OptimiserObjective.GreedyLoadDischarging in self.objectives:
+            self.import_weight += greedy_weight
+
+        if OptimiserObjective.EqualStorageActions in self.objectives:
+            self.action_weight += self.smallM
+
+        self.build_action_costs()
+
+    def storage_actions(self, deltas):
+        # The cheapest way to make each change in state of charge, deltas is (intervals, actions).
+        # Charging fills from whichever of solar and the grid is cheaper, discharging serves the load
+        # or the grid, with the solar and the load as the only limited sources.
+        storage = self.energy_system.energy_storage
+        consumption, generation = self.connection_point_profiles()
+        consumption = consumption[:, np.newaxis]
+        generation = generation[:, np.newaxis]
+        import_weight = self.import_weight[:, np.newaxis]
+        export_weight = self.export_weight[:, np.newaxis]
+
+        charge = np.maximum(deltas, 0) / storage.charging_efficiency
+        solar_first = export_weight <= import_weight
+        charge_generation = np.where(solar_first, np.minimum(charge, -generation), 0)
+        charge_grid = charge - charge_generation
+
+        discharge = np.minimum(deltas, 0) * storage.discharging_efficiency
+        load_first = import_weight >= export_weight
+        discharge_load = np.where(load_first, np.maximum(discharge, -consumption), 0)
+        discharge_grid = discharge - discharge_load
+
+        return {'storage_charge_total': np.maximum(deltas, 0),
+                'storage_discharge_total': np.minimum(deltas, 0),
+                'storage_charge_grid': charge_grid,
+                'storage_charge_generation': charge_generation,
+                'storage_discharge_load': discharge_load,
+                'storage_discharge_grid': discharge_grid,
+                'net_import': consumption + charge_grid + discharge_load,
+                'net_export': generation + charge_generation + discharge_grid}
+
+    def action_cost(self, actions):
+        return self.import_weight[:, np.newaxis] * actions['net_import'] + \
+               self.export_weight[:, np.newaxis] * actions['net_export'] + \
+               self.throughput_weight * (actions['storage_charge_total'] - actions['storage_discharge_total']) + \
+               self.action_weight * (actions['storage_charge_grid'] ** 2 + actions['storage_charge_generation'] ** 2 +
+                                     actions['storage_discharge_load'] ** 2 + actions['storage_discharge_grid'] ** 2)
+
+    def build_action_costs(self):
+        # The cost of each grid step in each interval, actions beyond the power limits are never taken
+        deltas = np.broadcast_to(self.step_deltas, (self.number_of_intervals, len(self.step_deltas)))
+        self.action_costs = np.where(self.step_feasible, self.action_cost(self.storage_actions(deltas)), np.inf)
+
+    def update_energy_system(self, energy_system):
+        # The cost tables are rebuilt for the new profiles and tariffs, a new initial
+        # state of charge moves the grid so the battery limits are re-applied as well
+        update_start = time.time()
+        self.energy_system = energy_system
+        self.build_model()
+        self.build_objective()
+        self.update_time = time.time() - update_start
+
+    def optimise(self):
+        solve_start = time.time()
+        number_of_states = len(self.state_of_charge)
+        lowest_offset = self.step_offsets[0]
+
+        # The cost to go from each state, steps off either end of the grid have infinite cost
+        cost_to_go = np.full(number_of_states - lowest_offset + self.step_offsets[-1], np.inf)
+        on_grid = slice(-lowest_offset, number_of_states - lowest_offset)
+        cost_to_go[on_grid] = 0
+        next_state = np.arange(number_of_states) + self.step_offsets[:, np.newaxis] - lowest_offset
+        states = np.arange(number_of_states)
+        policy = np.zeros((self.number_of_intervals, number_of_states), dtype=np.intp)
+
+        # Backward pass over the horizon, each state chooses its cheapest step
+        for interval in range(self.number_of_intervals - 1, -1, -1):
+            candidates = self.action_costs[interval][:, np.newaxis] + cost_to_go[next_state]
+            policy[interval] = np.argmin(candidates, axis=0)
+            cost_to_go[on_grid] = candidates[policy[interval], states]
+
+        # Forward pass from the initial state of charge
+        steps = np.zeros(self.number_of_intervals, dtype=np.intp)
+        state = self.initial_index
+        for interval in range(self.number_of_intervals):
+            steps[interval] = policy[interval, state]
+            state += self.step_offsets[steps[interval]]
+
+        deltas = self.step_deltas[steps][:, np.newaxis]
+        self.values = {name: value[:, 0] for name, value in self.storage_actions(deltas).items()}
+        self.values['storage_state_of_charge'] = self.state_of_charge[self.initial_index] + \
+            self.soc_resolution * np.cumsum(self.step_offsets[steps])
+        self.values['peak_connection_point_import_power'] = max(np.max(self.values['net_import']), 0)
+        self.values['peak_connection_point_export_power'] = max(np.max(-self.values['net_export']), 0)
+
+        self.objective_value = cost_to_go[on_grid][self.initial_index]
+        self.results = 'optimal' if np.isfinite(self.objective_value) else 'infeasible'
+        self.solve_time = time.time() - solve_start
+
+    def extract_results(self):
+        return OptimiserResults(self.values)
@@ -3,7 +3,9 @@ This is a draft script and is not the full version of the optimiser,
 it still remains the property of the Australian National University's Battery Storage and Grid Integration Program
 """
 
-from pyomo.opt import SolverFactory
+import time
+
+from pyomo.opt import SolverFactory, TerminationCondition
 import pyomo.environ as en
 import numpy as np
 import pandas as pd
@@ -56,21 +58,60 @@ class OptimiserObjectiveSet(object):
     DispatchOptimisation = [OptimiserObjective.PiecewiseLinear] + FinancialOptimisation
 
 
+class OptimiserResults(object):
+    # The time indexed optimisation variables
+    interval_variables = ['storage_state_of_charge',
+                          'storage_charge_total',
+                          'storage_discharge_total',
+                          'storage_charge_grid',
+                          'storage_charge_generation',
+                          'storage_discharge_load',
+                          'storage_discharge_grid',
+                          'net_import',
+                          'net_export']
+
+    # The single valued optimisation variables
+    scalar_variables = ['peak_connection_point_import_power',
+                        'peak_connection_point_export_power']
+
+    def __init__(self, values):
+        # Sets each variable from a {name: values} dictionary, interval variables as numpy arrays
+        for name in self.interval_variables + self.scalar_variables:
+            setattr(self, name, values[name])
+
+    @property
+    def storage_energy_delta(self):
+        # The total change in battery energy in each interval
+        return self.storage_charge_grid + self.storage_charge_generation + \
+               self.storage_discharge_load + self.storage_discharge_grid
+
+    @property
+    def net_connection_point(self):
+        # The optimised connection point load in each interval
+        return self.net_import + self.net_export
+
+
 # Define some useful constants
 minutes_per_hour = 60.0
 
+# The termination conditions of an external solver that leave a usable solution in the model
+solved_conditions = (TerminationCondition.optimal,
+                     TerminationCondition.globallyOptimal,
+                     TerminationCondition.locallyOptimal)
+
 ####################################################################
 
 
 class EnergyOptimiser(object):
     
-    def __init__(self, interval_duration, number_of_intervals, energy_system, objective):
+    def __init__(self, interval_duration, number_of_intervals, energy_system, objective, solve=True,
+                 optimiser_engine="cplex"):
         self.interval_duration = interval_duration  # The duration (in minutes) of each of the intervals being optimised over
         self.number_of_intervals = number_of_intervals
         self.energy_system = energy_system
 
         # This must be configured correctly on the host machine
-        self.optimiser_engine = "cplex"  # 'gurobi' / 'glpk'
+        self.optimiser_engine = optimiser_engine  # 'cplex' / 'gurobi' / 'glpk'
         # self.optimiser_engine_executable = "/Applications/CPLEX_Studio128/cplex/bin/x86-64_osx/cplex"
         # self.optimiser_engine_executable = "/opt/ibm/ILOG/CPLEX_Studio128/cplex/bin/x86-64_linux/cplex"
         self.optimiser_engine_executable = r"C:\Program Files\IBM\ILOG\CPLEX_Studio128\cplex\bin\x64_win64\cplex"
@@ -84,19 +125,22 @@ class EnergyOptimiser(object):
         self.smallM = 0.0001
 
         self.objectives = objective
+
+        # Time taken to build the model, to last update its parameters and to last solve it (seconds)
+        self.build_time = None
+        self.update_time = None
+        self.solve_time = None
+
+        build_start = time.time()
         self.build_model()
         self.apply_constraints()
         self.build_objective()
-        self.optimise()
-
-    def build_model(self):
-        # Set up the Pyomo model
-        self.model = en.ConcreteModel()
+        self.build_time = time.time() - build_start
 
-        # We use RangeSet to create a index for each of the time
-        # periods that we will optimise within.
-        self.model.Time = en.RangeSet(0, self.number_of_intervals - 1)
+        if solve:
+            self.optimise()
 
+    def connection_point_profiles(self):
         # Convert the data into the right format for the optimiser
         load = self.energy_system.load.load
         generation = self.energy_system.pv.pv
@@ -113,6 +157,48 @@ class EnergyOptimiser(object):
         import_load_dct = dict(enumerate(connection_point_import))
         export_load_dct = dict(enumerate(connection_point_export))
 
+        return import_load_dct, export_load_dct
+
+    def extract_results(self):
+        # Pulls the solved values of each variable by name, in time order, None when the solver did not solve the problem
+        if self.results.solver.termination_condition not in solved_conditions:
+            return None
+        values = dict()
+        for name in OptimiserResults.interval_variables:
+            variable = getattr(self.model, name)
+            values[name] = np.fromiter(variable.extract_values().values(), dtype=float, count=len(variable))
+        for name in OptimiserResults.scalar_variables:
+            values[name] = getattr(self.model, name).value
+
+        return OptimiserResults(values)
+
+    def update_energy_system(self, energy_system):
+        # Re-parameterise the existing model in place rather than rebuilding it.
+        # Only the profiles, tariffs and initial state of charge may change,
+        # the horizon, battery limits and objectives are fixed when the model is built.
+        update_start = time.time()
+        self.energy_system = energy_system
+
+        import_load_dct, export_load_dct = self.connection_point_profiles()
+        self.model.local_energy_consumption.store_values(import_load_dct)
+        self.model.local_energy_generation.store_values(export_load_dct)
+        self.model.priceBuy.store_values(self.energy_system.tariff.import_tariff)
+        self.model.priceSell.store_values(self.energy_system.tariff.export_tariff)
+        self.model.initial_state_of_charge.set_value(self.energy_system.energy_storage.initial_state_of_charge)
+
+        self.update_time = time.time() - update_start
+
+    def build_model(self):
+        # Set up the Pyomo model
+        self.model = en.ConcreteModel()
+
+        # We use RangeSet to create a index for each of the time
+        # periods that we will optimise within.
+        self.model.Time = en.RangeSet(0, self.number_of_intervals - 1)
+
+        # Convert the data into the right format for the optimiser
+        import_load_dct, export_load_dct = self.connection_point_profiles()
+
         #### Initialise the optimisation variables (all indexed by Time) ####
 
         # The state of charge of the battery
@@ -181,18 +267,25 @@ class EnergyOptimiser(object):
         self.model.DischargingLimit = en.Param(
             initialize=self.energy_system.energy_storage.discharging_power_limit * (self.interval_duration / minutes_per_hour))
 
+        # The battery state of charge at the start of the horizon
+        self.model.initial_state_of_charge = en.Param(
+            initialize=self.energy_system.energy_storage.initial_state_of_charge, mutable=True)
+
         #### Initial Load / Solar Profile Parameters ####
+        # These are mutable so a built model can be re-parameterised by update_energy_system
         # The local energy consumption
-        self.model.local_energy_consumption = en.Param(self.model.Time, initialize=import_load_dct)
+        self.model.local_energy_consumption = en.Param(self.model.Time, initialize=import_load_dct, mutable=True)
         # The local energy generation
-        self.model.local_energy_generation = en.Param(self.model.Time, initialize=export_load_dct)
+        self.model.local_energy_generation = en.Param(self.model.Time, initialize=export_load_dct, mutable=True)
 
 
         #### Tariffs and Financial Incentives ####
         # The import tariff per kWh
-        self.model.priceBuy = en.Param(self.model.Time, initialize=self.energy_system.tariff.import_tariff)
+        self.model.priceBuy = en.Param(self.model.Time, initialize=self.energy_system.tariff.import_tariff,
+                                       mutable=True)
         # The export tariff per kWh
-        self.model.priceSell = en.Param(self.model.Time, initialize=self.energy_system.tariff.export_tariff)
+        self.model.priceSell = en.Param(self.model.Time, initialize=self.energy_system.tariff.export_tariff,
+                                        mutable=True)
         # The throughput cost for the energy storage
         self.model.throughput_cost = en.Param(initialize=self.energy_system.energy_storage.throughput_cost)
 
@@ -301,12 +394,10 @@ class EnergyOptimiser(object):
         self.model.local_discharge_behaviour_constraint = en.Constraint(self.model.Time, rule=storage_discharging_consumption_behaviour)
 
         # Calculate the state of charge of the battery in each time interval
-        initial_state_of_charge = self.energy_system.energy_storage.initial_state_of_charge
-
         def SOC_rule(model, time_interval):
             if time_interval == 0:
                 return model.storage_state_of_charge[time_interval] \
-                       == initial_state_of_charge + model.storage_charge_total[time_interval] + \
+                       == model.initial_state_of_charge + model.storage_charge_total[time_interval] + \
                        model.storage_discharge_total[
                            time_interval]
             else:
@@ -442,5 +533,7 @@ class EnergyOptimiser(object):
             opt = SolverFactory(self.optimiser_engine)
 
         # Solve the optimisation
+        solve_start = time.time()
         self.results = opt.solve(self.model)
+        self.solve_time = time.time() - solve_start
 
@@ -0,0 +1,154 @@
+"""
+Optimises a fleet of energy systems over the same horizon, either as separate problems across a process pool
+or stacked into a single block-diagonal problem
+"""
+
+import multiprocessing
+import time
+
+import numpy as np
+import scipy.sparse as sp
+
+from optimiser.energy_optimiser import OptimiserResults
+from optimiser.matrix_optimiser import MatrixEnergyOptimiser
+
+
+####################################################################
+
+
+def optimise_energy_system(task):
+    # Solves a single energy system, this runs in the process pool workers
+    interval_duration, number_of_intervals, energy_system, objective, optimiser_engine = task
+    optimiser = MatrixEnergyOptimiser(interval_duration, number_of_intervals, energy_system, objective,
+                                      optimiser_engine=optimiser_engine)
+    return optimiser.extract_results()
+
+
+class FleetResults(OptimiserResults):
+
+    def __init__(self, results):
+        # Stacks the results of each energy system, interval variables as (systems, intervals) arrays
+        # and single valued variables as (systems,) arrays
+        if any(result is None for result in results):
+            print('Fleet optimisation not solved for every energy system')
+            raise ValueError('Unsolved energy system in the fleet')
+        super(FleetResults, self).__init__(
+            {name: np.array([getattr(result, name) for result in results], dtype=float)
+             for name in self.interval_variables + self.scalar_variables})
+
+
+class BlockDiagonalOptimiser(MatrixEnergyOptimiser):
+    """
+    The matrix forms of several MatrixEnergyOptimisers placed along a block diagonal,
+    solving it once solves every member
+    """
+
+    def __init__(self, members, optimiser_engine="cplex"):
+        self.members = members
+        first = members[0]
+
+        # Offsets of each member's variables and constraints within the stacked problem
+        self.offsets = np.cumsum([0] + [member.number_of_variables for member in members])
+        self.row_offsets = np.cumsum([0] + [member.number_of_constraints for member in members])
+
+        # The members are already built, so building the stacked model only places them along the diagonal
+        super(BlockDiagonalOptimiser, self).__init__(first.interval_duration, first.number_of_intervals,
+                                                     first.energy_system, first.objectives, solve=False,
+                                                     optimiser_engine=optimiser_engine)
+        self.optimiser_engine_executable = first.optimiser_engine_executable
+
+    def build_model(self):
+        # Each variable's columns are those of every member in turn
+        for name in self.interval_variables + self.scalar_variables:
+            self.columns[name] = np.concatenate([np.atleast_1d(member.columns[name]) + offset
+                                                 for member, offset in zip(self.members, self.offsets)])
+        self.number_of_variables = int(self.offsets[-1])
+
+        self.variable_lower = np.concatenate([member.variable_lower for member in self.members])
+        self.variable_upper = np.concatenate([member.variable_upper for member in self.members])
+
+    def apply_constraints(self):
+        for name in self.members[0].rows:
+            self.rows[name] = np.concatenate([member.rows[name] + offset
+                                              for member, offset in zip(self.members, self.row_offsets)])
+        self.number_of_constraints = int(self.row_offsets[-1])
+
+        self.A = sp.block_diag([member.A for member in self.members], format='csr')
+        self.update_profile_bounds()
+
+    def update_profile_bounds(self):
+        self.constraint_lower = np.concatenate([member.constraint_lower for member in self.members])
+        self.constraint_upper = np.concatenate([member.constraint_upper for member in self.members])
+
+    def build_objective(self):
+        self.linear = np.concatenate([member.linear for member in self.members])
+        self.quadratic = np.concatenate([member.quadratic for member in self.members])
+
+    def update_energy_system(self, energy_systems):
+        # One energy system per member, each member refreshes its own part before it is stacked again
+        update_start = time.time()
+        for member, energy_system in zip(self.members, energy_systems):
+            member.update_energy_system(energy_system)
+        self.energy_system = self.members[0].energy_system
+        self.update_profile_bounds()
+        self.build_objective()
+        self.update_time = time.time() - update_start
+
+    def optimise(self):
+        super(BlockDiagonalOptimiser, self).optimise()
+
+        # Hands each member its part of the solution, None when the stacked problem was not solved
+        for member, start, end in zip(self.members, self.offsets[:-1], self.offsets[1:]):
+            member.solution = None if self.solution is None else self.solution[start:end]
+            member.results = self.results
+
+
+class FleetOptimiser(object):
+
+    def __init__(self, interval_duration, number_of_intervals, energy_systems, objective,
+                 optimiser_engine="clarabel", processes=None):
+        self.interval_duration = interval_duration  # The duration (in minutes) of each of the intervals being optimised over
+        self.number_of_intervals = int(number_of_intervals)
+        self.energy_systems = energy_systems
+        self.objectives = objective
+        self.optimiser_engine = optimiser_engine
+
+        # The number of worker processes, defaults to the number of cores
+        self.processes = processes
+
+        # Time taken by the last fleet solve (seconds)
+        self.solve_time = None
+
+    def optimise_parallel(self):
+        # Each energy system is solved as its own problem across a process pool
+        solve_start = time.time()
+        tasks = [(self.interval_duration, self.number_of_intervals, energy_system, self.objectives,
+                  self.optimiser_engine) for energy_system in self.energy_systems]
+
+        pool = multiprocessing.Pool(self.processes)
+        try:
+            results = pool.map(optimise_energy_system, tasks)
+        finally:
+            pool.close()
+            pool.join()
+
+        self.solve_time = time.time() - solve_start
+        return FleetResults(results)
+
+    def optimise_block_diagonal(self):
+        # Every energy system is stacked into one problem for solvers which prefer fewer, larger solves
+        solve_start = time.time()
+        members = [MatrixEnergyOptimiser(self.interval_duration, self.number_of_intervals, energy_system,
+                                         self.objectives, solve=False, optimiser_engine=self.optimiser_engine)
+                   for energy_system in self.energy_systems]
+
+        stacked_optimiser = BlockDiagonalOptimiser(members, optimiser_engine=self.optimiser_engine)
+        stacked_optimiser.optimise()
+
+        self.solve_time = time.time() - solve_start
+        return FleetResults([member.extract_results() for member in members])
+
+    @property
+    def throughput(self):
+        # Energy systems optimised per second by the last fleet solve
+        return len(self.energy_systems) / self.solve_time
@@ -0,0 +1,353 @@
+"""
+A matrix-form builder for the energy optimisation problem in energy_optimiser.py,
+it assembles the same LP / QP from numpy arrays instead of per-interval Pyomo rules
+"""
+
+import time
+
+from pyomo.opt import SolverFactory
+from pyomo.core.expr.numeric_expr import LinearExpression
+from pyomo.core.util import quicksum
+import pyomo.kernel as pmo
+import numpy as np
+import scipy.sparse as sp
+
+from optimiser.energy_optimiser import OptimiserObjective, OptimiserResults, minutes_per_hour, solved_conditions
+from optimiser.solvers import in_process_solvers
+
+
+####################################################################
+
+
+def profile_array(profile):
+    # Profiles may be given as numpy arrays or as the {interval: value} dictionaries used by Pyomo
+    if isinstance(profile, dict):
+        return np.fromiter(profile.values(), dtype=float, count=len(profile))
+    return np.asarray(profile, dtype=float)
+
+
+class MatrixEnergyOptimiser(object):
+
+    # The time indexed optimisation variables, in the order they are declared in EnergyOptimiser,
+    # followed by the single valued variables
+    interval_variables = OptimiserResults.interval_variables
+    scalar_variables = OptimiserResults.scalar_variables
+
+    def __init__(self, interval_duration, number_of_intervals, energy_system, objective, solve=True,
+                 optimiser_engine="cplex"):
+        self.interval_duration = interval_duration  # The duration (in minutes) of each of the intervals being optimised over
+        self.number_of_intervals = int(number_of_intervals)
+
+        # The duration may also be given per interval, e.g. fine intervals followed by coarser blocks
+        self.interval_hours = np.broadcast_to(np.asarray(interval_duration, dtype=float) / minutes_per_hour,
+                                              (self.number_of_intervals,))
+        self.energy_system = energy_system
+
+        # External engines are driven through Pyomo and must be configured correctly on the host machine,
+        # the engines in solvers.in_process_solvers are given the matrices directly
+        self.optimiser_engine = optimiser_engine  # 'cplex' / 'gurobi' / 'glpk' / 'clarabel'
+        self.optimiser_engine_executable = r"C:\Program Files\IBM\ILOG\CPLEX_Studio128\cplex\bin\x64_win64\cplex"
+
+        # This value has been arbitrarily chosen, it matches the value used by EnergyOptimiser
+        self.smallM = 0.0001
+
+        self.objectives = objective
+
+        # Column and row layout of the problem
+        self.columns = dict()
+        self.number_of_variables = 0
+        self.rows = dict()
+        self.number_of_constraints = 0
+
+        # Matrix form of the problem
+        #   minimise    linear . x + sum(quadratic * x ** 2)
+        #   subject to  constraint_lower <= A x <= constraint_upper
+        #               variable_lower <= x <= variable_upper
+        self.variable_lower = None
+        self.variable_upper = None
+        self.A = None
+        self.constraint_lower = None
+        self.constraint_upper = None
+        self.linear = None
+        self.quadratic = None
+
+        # Solved variable values, ordered as the columns of A
+        self.model = None
+        self.in_process_solver = None
+        self.results = None
+        self.solution = None
+
+        # Time taken to build the model, to last update its parameters and to last solve it (seconds)
+        self.build_time = None
+        self.update_time = None
+        self.solve_time = None
+
+        build_start = time.time()
+        self.build_model()
+        self.apply_constraints()
+        self.build_objective()
+        self.build_time = time.time() - build_start
+
+        if solve:
+            self.optimise()
+
+    def connection_point_profiles(self):
+        # split net load into import and export
+        load = profile_array(self.energy_system.load.load)
+        generation = profile_array(self.energy_system.pv.pv)
+        net_load = load + generation
+
+        connection_point_import = np.where(net_load >= 0, net_load, 0.0)
+        connection_point_export = np.where(net_load >= 0, 0.0, net_load)
+
+        return connection_point_import, connection_point_export
+
+    def build_model(self):
+        n = self.number_of_intervals
+        storage = self.energy_system.energy_storage
+        interval_hours = self.interval_hours
+
+        # Each time indexed variable occupies a contiguous block of n columns
+        for k, name in enumerate(self.interval_variables):
+            self.columns[name] = np.arange(k * n, (k + 1) * n)
+        for k, name in enumerate(self.scalar_variables):
+            self.columns[name] = len(self.interval_variables) * n + k
+        self.number_of_variables = len(self.interval_variables) * n + len(self.scalar_variables)
+
+        # Variable bounds, free variables are unbounded
+        self.variable_lower = np.full(self.number_of_variables, -np.inf)
+        self.variable_upper = np.full(self.number_of_variables, np.inf)
+
+        def set_bounds(name, lower, upper):
+            self.variable_lower[self.columns[name]] = lower
+            self.variable_upper[self.columns[name]] = upper
+
+        set_bounds('storage_state_of_charge', 0, storage.capacity)
+        set_bounds('storage_charge_grid', 0, storage.charging_power_limit * interval_hours)
+        set_bounds('storage_charge_generation', 0, storage.charging_power_limit * interval_hours)
+        set_bounds('storage_discharge_load', storage.discharging_power_limit * interval_hours, 0)
+        set_bounds('storage_discharge_grid', storage.discharging_power_limit * interval_hours, 0)
+        set_bounds('peak_connection_point_import_power', 0, np.inf)
+        set_bounds('peak_connection_point_export_power', 0, np.inf)
+
+    def apply_constraints(self):
+        n = self.number_of_intervals
+        storage = self.energy_system.energy_storage
+        interval_hours = self.interval_hours
+        intervals = np.arange(n)
+        col = self.columns
+
+        row_index = list()
+        col_index = list()
+        values = list()
+        lower = list()
+        upper = list()
+
+        # Every constraint is indexed by Time, so each block adds n rows.
+        # The blocks follow the order the constraints are declared in EnergyOptimiser.
+        def add_constraint(name, terms, constraint_lower, constraint_upper):
+            first_row = self.number_of_constraints
+            for columns, coefficient in terms:
+                row_index.append(first_row + intervals)
+                col_index.append(np.broadcast_to(columns, (n,)))
+                values.append(np.full(n, coefficient, dtype=float))
+            lower.append(np.broadcast_to(np.asarray(constraint_lower, dtype=float), (n,)))
+            upper.append(np.broadcast_to(np.asarray(constraint_upper, dtype=float), (n,)))
+            self.rows[name] = np.arange(first_row, first_row + n)
+            self.number_of_constraints += n
+
+        # Connection point peak power
+        add_constraint('peak_connection_point_import_constraint',
+                       [(col['peak_connection_point_import_power'], 1), (col['net_import'], -1)], 0, np.inf)
+        add_constraint('peak_connection_point_export_constraint',
+                       [(col['peak_connection_point_export_power'], 1), (col['net_export'], 1)], 0, np.inf)
+
+        # Charge and discharge behaviour, accounting for the storage efficiency
+        add_constraint('storage_charge_behaviour_constraint',
+                       [(col['storage_charge_grid'], 1), (col['storage_charge_generation'], 1),
+                        (col['storage_charge_total'], -1 / storage.charging_efficiency)], 0, 0)
+        add_constraint('storage_discharge_behaviour_constraint',
+                       [(col['storage_discharge_load'], 1), (col['storage_discharge_grid'], 1),
+                        (col['storage_discharge_total'], -storage.discharging_efficiency)], 0, 0)
+
+        # Charge and discharge rate limits
+        add_constraint('storage_charge_rate_limit_constraint',
+                       [(col['storage_charge_grid'], 1), (col['storage_charge_generation'], 1)],
+                       -np.inf, storage.charging_power_limit * interval_hours)
+        add_constraint('storage_discharge_rate_limit_constraint',
+                       [(col['storage_discharge_load'], 1), (col['storage_discharge_grid'], 1)],
+                       storage.discharging_power_limit * interval_hours, np.inf)
+
+        # Limits of charging from local generation and discharging to local demand, these
+        # depend on the profiles so their bounds are set in update_profile_bounds
+        add_constraint('solar_charging_behaviour_constraint',
+                       [(col['storage_charge_generation'], 1)], -np.inf, np.inf)
+        add_constraint('local_discharge_behaviour_constraint',
+                       [(col['storage_discharge_load'], 1)], -np.inf, np.inf)
+
+        # State of charge, the previous interval term is left out of the first row
+        first_row = self.number_of_constraints
+        add_constraint('Batt_SOC',
+                       [(col['storage_state_of_charge'], 1), (col['storage_charge_total'], -1),
+                        (col['storage_discharge_total'], -1)], 0, 0)
+        row_index.append(first_row + intervals[1:])
+        col_index.append(col['storage_state_of_charge'][:-1])
+        values.append(np.full(n - 1, -1.0))
+
+        # Net import and export at the connection point
+        add_constraint('net_import_constraint',
+                       [(col['net_import'], 1), (col['storage_charge_grid'], -1),
+                        (col['storage_discharge_load'], -1)], 0, 0)
+        add_constraint('net_export_constraint',
+                       [(col['net_export'], 1), (col['storage_charge_generation'], -1),
+                        (col['storage_discharge_grid'], -1)], 0, 0)
+
+        self.A = sp.csr_matrix((np.concatenate(values), (np.concatenate(row_index), np.concatenate(col_index))),
+                               shape=(self.number_of_constraints, self.number_of_variables))
+        self.constraint_lower = np.concatenate(lower)
+        self.constraint_upper = np.concatenate(upper)
+
+        self.update_profile_bounds()
+
+    def update_profile_bounds(self):
+        connection_point_import, connection_point_export = self.connection_point_profiles()
+        initial_state_of_charge = self.energy_system.energy_storage.initial_state_of_charge
+
+        self.constraint_upper[self.rows['solar_charging_behaviour_constraint']] = -connection_point_export
+        self.constraint_lower[self.rows['local_discharge_behaviour_constraint']] = -connection_point_import
+
+        soc_rows = self.rows['Batt_SOC']
+        self.constraint_lower[soc_rows] = 0
+        self.constraint_lower[soc_rows[0]] = initial_state_of_charge
+        self.constraint_upper[soc_rows] = self.constraint_lower[soc_rows]
+
+        for name, profile in (('net_import_constraint', connection_point_import),
+                              ('net_export_constraint', connection_point_export)):
+            self.constraint_lower[self.rows[name]] = profile
+            self.constraint_upper[self.rows[name]] = profile
+
+    def build_objective(self):
+        n = self.number_of_intervals
+        storage = self.energy_system.energy_storage
+        col = self.columns
+
+        self.linear = np.zeros(self.number_of_variables)
+        self.quadratic = np.zeros(self.number_of_variables)
+
+        # Weighting for the greedy objectives which favour earlier intervals,
+        # by the start time of each interval so that it also holds for varying interval durations
+        interval_start = np.cumsum(self.interval_hours) - self.interval_hours
+        greedy_weight = 1 / n * (1 - interval_start / np.sum(self.interval_hours))
+
+        if OptimiserObjective.ConnectionPointCost in self.objectives:
+            # Connection point cost
+            self.linear[col['net_import']] += profile_array(self.energy_system.tariff.import_tariff)
+            self.linear[col['net_export']] += profile_array(self.energy_system.tariff.export_tariff)
+
+        if OptimiserObjective.ConnectionPointEnergy in self.objectives:
+            # The amount of energy crossing the meter boundary
+            self.linear[col['net_export']] -= 1
+            self.linear[col['net_import']] += 1
+
+        if OptimiserObjective.ThroughputCost in self.objectives:
+            # Throughput cost of using energy storage - half attributed to charging and half to discharging
+            self.linear[col['storage_charge_total']] += storage.throughput_cost / 2.0
+            self.linear[col['storage_discharge_total']] -= storage.throughput_cost / 2.0
+
+        if OptimiserObjective.Throughput in self.objectives:
+            # Throughput of using energy storage - it mirrors the throughput cost above
+            self.linear[col['storage_charge_total']] += self.smallM
+            self.linear[col['storage_discharge_total']] -= self.smallM
+
+        if OptimiserObjective.GreedySolarCharging in self.objectives:
+            # Greedy Solar - Favour charging fully from solar in earlier intervals
+            self.linear[col['net_export']] -= greedy_weight
+
+        if OptimiserObjective.GreedyLoadDischarging in self.objectives:
+            # Greedy Load Discharging - Favour satisfying all load from the storage in earlier intervals
+            self.linear[col['net_import']] += greedy_weight
+
+        if OptimiserObjective.EqualStorageActions in self.objectives:
+            for name in ('storage_charge_grid', 'storage_charge_generation',
+                         'storage_discharge_grid', 'storage_discharge_load'):
+                self.quadratic[col[name]] += self.smallM
+
+        if OptimiserObjective.ConnectionPointPeakPower in self.objectives:
+            self.linear[col['peak_connection_point_import_power']] += 1
+            self.linear[col['peak_connection_point_export_power']] += 1
+
+        if OptimiserObjective.ConnectionPointQuantisedPeak in self.objectives:
+            self.quadratic[col['net_export']] += 1
+            self.quadratic[col['net_import']] += 1
+
+    def update_energy_system(self, energy_system):
+        # Only the profiles, tariffs and initial state of charge are refreshed,
+        # the horizon, battery limits and objectives are fixed when the model is built.
+        update_start = time.time()
+        self.energy_system = energy_system
+        self.update_profile_bounds()
+        self.build_objective()
+        self.update_time = time.time() - update_start
+
+    def build_pyomo_model(self):
+        # Hands the matrices to Pyomo so that any of its solvers can be used
+        self.model = pmo.block()
+        self.model.x = pmo.variable_list(
+            pmo.variable(lb=None if np.isinf(lower) else lower, ub=None if np.isinf(upper) else upper)
+            for lower, upper in zip(self.variable_lower, self.variable_upper))
+        self.model.constraints = pmo.matrix_constraint(self.A, x=self.model.x)
+        self.model.total_cost = pmo.objective(sense=pmo.minimize)
+
+    def update_pyomo_model(self):
+        # Refreshes the profile dependent constraint bounds and the objective
+        self.model.constraints.lb = self.constraint_lower
+        self.model.constraints.ub = self.constraint_upper
+
+        linear_terms = np.flatnonzero(self.linear)
+        quadratic_terms = np.flatnonzero(self.quadratic)
+        self.model.total_cost.expr = \
+            LinearExpression(constant=0,
+                             linear_coefs=self.linear[linear_terms].tolist(),
+                             linear_vars=[self.model.x[i] for i in linear_terms]) + \
+            quicksum(self.quadratic[i] * self.model.x[i] * self.model.x[i] for i in quadratic_terms)
+
+    def optimise(self):
+        solve_start = time.time()
+
+        # In-process solvers keep their own copy of the problem between solves
+        if self.optimiser_engine in in_process_solvers:
+            if self.in_process_solver is None:
+                self.in_process_solver = in_process_solvers[self.optimiser_engine]()
+            self.solution = self.in_process_solver.solve(self)
+            self.results = self.in_process_solver.status
+            self.solve_time = time.time() - solve_start
+            return
+
+        if self.model is None:
+            self.build_pyomo_model()
+        self.update_pyomo_model()
+
+        # set the path to the solver
+        if self.optimiser_engine == 'cplex':
+            opt = SolverFactory(self.optimiser_engine, executable=self.optimiser_engine_executable)
+        else:
+            opt = SolverFactory(self.optimiser_engine)
+
+        # Solve the optimisation, the variables are only loaded when the solver solved the problem
+        self.results = opt.solve(self.model)
+        if self.results.solver.termination_condition in solved_conditions:
+            self.solution = np.fromiter((variable.value for variable in self.model.x), dtype=float,
+                                        count=self.number_of_variables)
+        else:
+            self.solution = None
+        self.solve_time = time.time() - solve_start
+
+    def variable_values(self, name):
+        return self.solution[self.columns[name]]
+
+    def extract_results(self):
+        # Each variable is a slice of the solution vector, None when the solver did not solve the problem
+        if self.solution is None:
+            return None
+        return OptimiserResults({name: self.variable_values(name)
+                                 for name in self.interval_variables + self.scalar_variables})
@@ -3,7 +3,6 @@
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
-from pyomo.core import Var
 
 # Since using the data-driven data for the testing, use their battery class
 import sys
@@ -118,24 +117,11 @@ optimiser = EnergyOptimiser(5, 288, energy_system, OptimiserObjectiveSet.PeakOpt
 
 
 ############################ Analyse the Optimisation ########################################
-model = optimiser.model
+results = optimiser.extract_results()
 
-num_ouputvars = 12
-outputVars = np.zeros((num_ouputvars, len(export_tariff)))
-
-j = 0
-for v in model.component_objects(Var, active=True):
-    print(v)
-    varobject = getattr(model, str(v))
-    for index in varobject:
-        outputVars[j, index] = varobject[index].value
-    j += 1
-    if j >= num_ouputvars:
-        break
-
-storage_energy_delta = outputVars[3] + outputVars[4] + outputVars[5] + outputVars[6]
-optimised_connection_point_load = outputVars[7] + outputVars[8]
-print(outputVars[8])
+storage_energy_delta = results.storage_energy_delta
+optimised_connection_point_load = results.net_connection_point
+print(results.net_export)
 
 colors = sns.color_palette()
 hrs = np.arange(0, len(test_load)) / 4
@@ -155,8 +141,8 @@ ax2.set_xlabel('hour'), ax2.set_ylabel('price')
 ax2.legend([l1, l2], ['buy price', 'sell price'], ncol=2)
 ax2.set_xlim([0, len(test_load) / 4])
 ax3 = fig.add_subplot(3, 1, 3)
-l1, = ax3.plot(hrs, np.sum(outputVars[3:7, :] * 4, axis=0), color=colors[5])
-l2, = ax3.plot(hrs, outputVars[0], color=colors[4])
+l1, = ax3.plot(hrs, storage_energy_delta * 4, color=colors[5])
+l2, = ax3.plot(hrs, results.storage_state_of_charge, color=colors[4])
 ax3.set_xlabel('hour'), ax3.set_ylabel('action')
 ax3.legend([l1, l2], ['battery action (kW)', 'SOC (kWh)'], ncol=2)
 ax3.set_xlim([0, len(test_load) / 4])
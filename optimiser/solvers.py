@@ -0,0 +1,96 @@
+"""
+In-process solvers for the matrix form built by MatrixEnergyOptimiser,
+the matrices are passed straight to the solver libraries with no subprocess or LP / solution files
+"""
+
+import numpy as np
+import scipy.sparse as sp
+
+
+class ClarabelSolver(object):
+    """
+    The Clarabel interior point QP solver ('pip install clarabel').
+    An interior point method is used as the objectives only carry a small quadratic term (EqualStorageActions),
+    the HiGHS active set QP method and OSQP both stall on these near-linear problems.
+    """
+
+    def __init__(self):
+        import clarabel
+        self.clarabel = clarabel
+        self.solver = None
+        self.status = None
+
+        # Rows of the conic form, equalities first then the finite upper and lower bounds
+        self.equality_rows = None
+        self.upper_rows = None
+        self.lower_rows = None
+        self.upper_columns = None
+        self.lower_columns = None
+
+    def conic_vector(self, optimiser):
+        return np.concatenate([optimiser.constraint_lower[self.equality_rows],
+                               optimiser.constraint_upper[self.upper_rows],
+                               -optimiser.constraint_lower[self.lower_rows],
+                               optimiser.variable_upper[self.upper_columns],
+                               -optimiser.variable_lower[self.lower_columns]])
+
+    def bound_rows(self, optimiser):
+        equality = optimiser.constraint_lower == optimiser.constraint_upper
+        return (equality,
+                ~equality & np.isfinite(optimiser.constraint_upper),
+                ~equality & np.isfinite(optimiser.constraint_lower),
+                np.isfinite(optimiser.variable_upper),
+                np.isfinite(optimiser.variable_lower))
+
+    def setup(self, optimiser):
+        # Clarabel solves  min 1/2 x'Px + q'x  subject to  Ax + s = b, s in the given cones
+        self.equality_rows, self.upper_rows, self.lower_rows, self.upper_columns, self.lower_columns = \
+            self.bound_rows(optimiser)
+
+        constraint_matrix = optimiser.A.tocsr()
+        identity = sp.identity(optimiser.number_of_variables, format='csr')
+        conic_matrix = sp.vstack([constraint_matrix[self.equality_rows],
+                                  constraint_matrix[self.upper_rows],
+                                  -constraint_matrix[self.lower_rows],
+                                  identity[self.upper_columns],
+                                  -identity[self.lower_columns]], format='csc')
+        number_of_equalities = int(np.count_nonzero(self.equality_rows))
+        cones = [self.clarabel.ZeroConeT(number_of_equalities),
+                 self.clarabel.NonnegativeConeT(conic_matrix.shape[0] - number_of_equalities)]
+
+        settings = self.clarabel.DefaultSettings()
+        settings.verbose = False
+
+        hessian = sp.diags(2 * optimiser.quadratic, format='csc')
+        self.solver = self.clarabel.DefaultSolver(hessian, optimiser.linear, conic_matrix,
+                                                  self.conic_vector(optimiser), cones, settings)
+
+    def solve(self, optimiser):
+        # The cone structure only holds while the same constraints stay equalities and bounded
+        same_structure = self.solver is not None and all(
+            np.array_equal(previous, current) for previous, current in zip(
+                (self.equality_rows, self.upper_rows, self.lower_rows, self.upper_columns, self.lower_columns),
+                self.bound_rows(optimiser)))
+
+        if same_structure and self.solver.is_data_update_allowed():
+            self.solver.update(q=optimiser.linear, b=self.conic_vector(optimiser))
+        else:
+            self.setup(optimiser)
+
+        # Only a fully solved problem gives a schedule, None otherwise (e.g. MaxIterations, NumericalError, infeasible)
+        solution = self.solver.solve()
+        self.status = str(solution.status)
+        if self.status != "Solved":
+            return None
+        return np.array(solution.x)
+
+
+def solver_status(results):
+    # External solvers return Pyomo results, the in-process solvers a status string
+    if hasattr(results, 'solver'):
+        return str(results.solver.termination_condition)
+    return str(results)
+
+
+# The solvers that run inside this process on the matrix form, by optimiser_engine name
+in_process_solvers = {"clarabel": ClarabelSolver}